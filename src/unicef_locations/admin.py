@@ -11,9 +11,12 @@ from django.template import loader
 from django.urls import NoReverseMatch, reverse
 from django.utils.html import format_html
 from leaflet.admin import LeafletGeoAdmin
+from leaflet.forms.widgets import LeafletWidget
 from mptt.admin import MPTTModelAdmin
 
-from unicef_locations.auth import LocationsCartoNoAuthClient
+from unicef_locations.auth import get_carto_client
+from unicef_locations.geometry import get_geometry_field, get_resolution
+from unicef_locations.retry import get_retry_policy
 from unicef_locations.utils import get_location_model, get_remapping
 
 from .forms import CartoDBTableForm
@@ -68,17 +71,42 @@ class LocationAdmin(LeafletGeoAdmin, MPTTModelAdmin):
     raw_id_fields = ("parent",)
 
     def get_queryset(self, request):  # pragma: no-cover
-        qs = get_location_model().objects.all()
+        # geom is only rendered by the change form, which loads it on access
+        qs = get_location_model().objects.lean()
 
         ordering = self.get_ordering(request)
         if ordering:
             qs = qs.order_by(*ordering)
         return qs
 
-    def get_form(self, request, obj=None, **kwargs):
-        self.readonly_fields = [] if request.user.is_superuser else ["p_code", "geom", "point", "admin_level"]
-
-        return super().get_form(request, obj, **kwargs)
+    def get_resolution(self, request):
+        try:
+            return get_resolution(request.GET)
+        except ValueError:
+            return None
+
+    def get_object(self, request, object_id, from_field=None):
+        obj = super().get_object(request, object_id, from_field)
+        resolution = self.get_resolution(request)
+        if obj is not None and resolution:
+            # display the stored simplified geometry (?resolution=coarse|medium|fine), it is never saved
+            obj.geom = getattr(obj, get_geometry_field(resolution))
+        return obj
+
+    def get_readonly_fields(self, request, obj=None):
+        return [] if request.user.is_superuser else ["p_code", "geom", "point", "admin_level"]
+
+    def formfield_for_dbfield(self, db_field, request=None, **kwargs):
+        formfield = super().formfield_for_dbfield(db_field, request, **kwargs)
+        if formfield is not None and isinstance(formfield.widget, LeafletWidget) and request is not None:
+            # the map of a simplified geometry is read only, the admin instance is shared by the requests
+            formfield.widget.modifiable = self.get_resolution(request) is None
+        return formfield
+
+    def save_model(self, request, obj, form, change):
+        if change and self.get_resolution(request):
+            obj.geom = get_location_model().objects.values_list("geom", flat=True).get(pk=obj.pk)
+        super().save_model(request, obj, form, change)
 
 
 class CartoDBTableAdmin(ExtraUrlMixin, admin.ModelAdmin):
@@ -107,8 +135,10 @@ class CartoDBTableAdmin(ExtraUrlMixin, admin.ModelAdmin):
     @button(css_class="btn-warning auto-disable")
     def show_remap_table(self, request, pk):
         carto_table = CartoDBTable.objects.get(pk=pk)
-        sql_client = SQLClient(LocationsCartoNoAuthClient(base_url=f"https://{carto_table.domain}.carto.com/"))
-        old2new, to_deactivate = get_remapping(sql_client, carto_table)
+        sql_client = SQLClient(get_carto_client(carto_table.domain))
+        # short retries, the user is waiting
+        retry_policy = get_retry_policy(max_attempts=2, max_delay=1)
+        old2new, to_deactivate = get_remapping(sql_client, carto_table, retry_policy)
         template = loader.get_template("admin/location_remap.html")
         context = {"old2new": old2new, "to_deactivate": to_deactivate}
         return HttpResponse(template.render(context, request))
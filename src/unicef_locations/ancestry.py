@@ -0,0 +1,104 @@
+"""
+Maintenance of the denormalized display names and ancestry paths of the locations.
+
+A location's own columns are computed when it is saved (see AbstractLocation.save); the columns of
+whole subtrees are rebuilt in set-based SQL through `refresh_ancestry`, e.g. at the end of a
+synchronization or when a location with descendants is renamed or moved.
+"""
+
+import logging
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.db.models import Case, CharField, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Concat
+
+from .utils import get_location_model
+
+logger = logging.getLogger(__name__)
+
+PCODE_SEPARATOR = "/"
+NAME_SEPARATOR = " > "
+
+# columns the denormalized ones are computed from
+SOURCE_FIELDS = ("name", "is_active", "admin_level_name", "p_code", "parent")
+DERIVED_FIELDS = ("display_name", "full_name", "ancestry_pcodes", "ancestry_names")
+
+
+def format_display_name(name, is_active, admin_level_name, p_code):
+    return "{}{} ({}: {})".format(name, "" if is_active else " [Archived]", admin_level_name, p_code or "")
+
+
+def format_full_name(display_name, parent_name):
+    return "{}{}".format(display_name, " -- {}".format(parent_name) if parent_name else "")
+
+
+def format_pcode_path(p_codes):
+    """
+    Ancestry path of p_codes, root first and including the location itself, e.g. "/RW/RW01/".
+    The locations of a subtree are the ones whose path starts with the path of its root.
+    """
+    return "{0}{1}{0}".format(PCODE_SEPARATOR, PCODE_SEPARATOR.join(p_codes))
+
+
+def display_name_expression():
+    return Concat(
+        F("name"),
+        Case(When(is_active=True, then=Value("")), default=Value(" [Archived]")),
+        Value(" ("),
+        Coalesce(F("admin_level_name"), Value("None")),
+        Value(": "),
+        F("p_code"),
+        Value(")"),
+        output_field=CharField(),
+    )
+
+
+def refresh_ancestry(queryset):
+    """
+    Rebuild the display names and ancestry paths of the locations in `queryset`, reading the
+    ancestors from the MPTT ranges, so that the whole update is a single statement.
+    """
+    # the model of the queryset, which can be a historical model in a data migration
+    model = queryset.model
+    ancestors = (
+        model._default_manager.filter(tree_id=OuterRef("tree_id"), lft__lte=OuterRef("lft"), rght__gte=OuterRef("rght"))
+        .order_by()
+        .values("tree_id")
+    )
+    parent_name = model._default_manager.filter(pk=OuterRef("parent_id")).order_by().values("name")
+    display_name = display_name_expression()
+
+    updated = queryset.order_by().update(
+        display_name=display_name,
+        full_name=Concat(
+            display_name,
+            Coalesce(Concat(Value(" -- "), Subquery(parent_name)), Value("")),
+            output_field=CharField(),
+        ),
+        ancestry_pcodes=Concat(
+            Value(PCODE_SEPARATOR),
+            Subquery(ancestors.annotate(path=StringAgg("p_code", PCODE_SEPARATOR, ordering="lft")).values("path")),
+            Value(PCODE_SEPARATOR),
+            output_field=CharField(),
+        ),
+        ancestry_names=Subquery(
+            ancestors.annotate(path=StringAgg("name", NAME_SEPARATOR, ordering="lft")).values("path")
+        ),
+    )
+    logger.info(f"Refreshed {updated} ancestry paths")
+
+
+def filter_by_ancestor(queryset, p_code):
+    """
+    Locations in the subtree of the active location `p_code` (included), as a prefix match on the stored paths
+    """
+    path = (
+        get_location_model()
+        .objects.lean()
+        .filter(p_code=p_code, is_active=True)
+        .values_list("ancestry_pcodes", flat=True)
+        .first()
+    )
+    if not path:
+        return queryset.none()
+    return queryset.filter(ancestry_pcodes__startswith=path)
@@ -1,6 +1,17 @@
+import os
+import threading
+
+import requests
 from carto.auth import _BaseUrlChecker
 from carto.exceptions import CartoException
 from pyrestcli.auth import BaseAuthClient
+from requests.adapters import HTTPAdapter
+
+from .config import conf
+
+# one keep-alive session per Carto domain, shared by the threads of the process
+_clients = {}
+_clients_lock = threading.Lock()
 
 
 class LocationsCartoNoAuthClient(_BaseUrlChecker, BaseAuthClient):
@@ -8,12 +19,51 @@ class LocationsCartoNoAuthClient(_BaseUrlChecker, BaseAuthClient):
     Simple Carto Auth class, without the API key in the request
     """
 
-    def __init__(self, base_url):
+    def __init__(self, base_url, session=None):
         base_url = self.check_base_url(base_url)
-        super().__init__(base_url)
+        super().__init__(base_url, session)
 
     def send(self, relative_path, http_method, **requests_args):
+        requests_args.setdefault("timeout", (conf.CARTO_CONNECT_TIMEOUT, conf.CARTO_READ_TIMEOUT))
         try:
             return super().send(relative_path, http_method.lower(), **requests_args)
         except Exception as e:  # pragma: no cover
             raise CartoException(e)
+
+
+def create_session():
+    session = requests.Session()
+    # pool_block caps the connections to the domain, the extra threads wait for a free connection
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=conf.CARTO_POOL_MAXSIZE, pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    return session
+
+
+def get_carto_client(domain):
+    """
+    Shared client of the Carto `domain`, its pooled connections are kept alive between the requests
+    """
+    with _clients_lock:
+        if domain not in _clients:
+            _clients[domain] = LocationsCartoNoAuthClient(f"https://{domain}.carto.com/", session=create_session())
+        return _clients[domain]
+
+
+def close_carto_clients():
+    with _clients_lock:
+        for client in _clients.values():
+            client.session.close()
+        _clients.clear()
+
+
+def _reset_after_fork():
+    # the connections of the parent (e.g. celery prefork) must not be shared with the child
+    global _clients_lock
+    _clients_lock = threading.Lock()
+    _clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
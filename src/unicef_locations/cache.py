@@ -2,6 +2,7 @@ import uuid
 from functools import wraps
 
 from django.core.cache import cache
+from django.db import transaction
 from django.utils.cache import patch_cache_control
 from django.utils.text import slugify
 from rest_framework import status
@@ -25,11 +26,25 @@ def invalidate_cache():
         cache.set(conf.CACHE_VERSION_KEY, 1)
 
 
+def invalidate_cache_on_commit(using=None):
+    """
+    Invalidate the cache once the current transaction is committed, registered once per transaction
+    (a synchronization saves thousands of locations)
+    """
+    pending = transaction.get_connection(using).run_on_commit
+    if not any(callback[1] is invalidate_cache for callback in pending):
+        transaction.on_commit(invalidate_cache, using=using)
+
+
 def get_cache_key(request: Request):
     if hasattr(request._request, "get_full_path"):
         url = str(request._request.get_full_path())
     else:
         url = str(request._request.get_raw_uri())
+    # each representation (JSON, columnar, msgpack...) has its own ETag
+    renderer_format = getattr(getattr(request, "accepted_renderer", None), "format", "json")
+    if renderer_format != "json":
+        url = f"{url}-{renderer_format}"
     return "locations-etag-%s-%s" % (get_cache_version(), slugify(url))
 
 
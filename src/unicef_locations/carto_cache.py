@@ -0,0 +1,155 @@
+"""
+On-disk cache of the pages fetched from Carto, enabled by the ``UNICEF_LOCATIONS_CARTO_CACHE_DIR`` setting.
+
+Pages are stored once per content (``objects/<sha256>.json``) and referenced by a key built from
+the table data version and the page query (``pages/<table sha256>/<sha256>``), so that a
+synchronization retried after a failure reads the pages already fetched from disk instead of
+downloading them again, as long as the Carto table did not change. The cache is not used when the
+last update time of the Carto table cannot be read. A checkpoint records the progress of the running
+synchronization; the checkpoint and the pages of the table are removed once it succeeds, and the
+objects no longer referenced are pruned, so the cache only serves resumes.
+
+The cache can be removed at any time.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from django.utils import timezone
+
+from .config import conf
+
+logger = logging.getLogger(__name__)
+
+# objects written since are kept by the pruning, their page may not be written yet (concurrent syncs)
+PRUNE_GRACE_PERIOD = 3600
+
+
+def get_digest(*parts):
+    return hashlib.sha256("\n".join(str(part) for part in parts).encode()).hexdigest()
+
+
+def write_atomic(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as output:
+        output.write(content)
+    os.replace(tmp, path)
+
+
+class CartoPageCache:
+    def __init__(self, domain, table_name, version, root=None):
+        self.root = root or conf.CARTO_CACHE_DIR
+        self.domain = domain
+        self.table_name = table_name
+        self.version = version
+
+    @classmethod
+    def for_table(cls, carto, version):
+        """
+        Cache of the pages of `carto` (CartoDBTable) at `version`, None if the cache is disabled
+        or the version of the table is unknown
+        """
+        if not conf.CARTO_CACHE_DIR or version is None:
+            return None
+        return cls(carto.domain, carto.table_name, version)
+
+    @property
+    def pages_path(self):
+        return os.path.join(self.root, "pages", get_digest(self.domain, self.table_name))
+
+    def get_page_path(self, query):
+        return os.path.join(self.pages_path, get_digest(self.version, query))
+
+    def get_object_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], f"{digest}.json")
+
+    @property
+    def checkpoint_path(self):
+        return os.path.join(self.root, "checkpoints", f"{get_digest(self.domain, self.table_name)}.json")
+
+    def get(self, query):
+        """
+        Rows of the page fetched with `query`, None if they are not cached
+        """
+        try:
+            with open(self.get_page_path(query)) as page:
+                digest = page.read().strip()
+            with open(self.get_object_path(digest), "rb") as content:
+                return json.loads(content.read())
+        except (OSError, ValueError):
+            return None
+
+    def set(self, query, rows):
+        content = json.dumps(rows).encode()
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.get_object_path(digest)
+        if not os.path.exists(path):
+            write_atomic(path, content)
+        write_atomic(self.get_page_path(query), digest.encode())
+
+    def get_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as checkpoint:
+                return json.load(checkpoint)
+        except (OSError, ValueError):
+            return None
+
+    def save_checkpoint(self, offset):
+        """
+        Record that the pages up to `offset` of the current version are cached
+        """
+        checkpoint = {
+            "domain": self.domain,
+            "table_name": self.table_name,
+            "version": self.version,
+            "offset": offset,
+            "updated": timezone.now().isoformat(),
+        }
+        write_atomic(self.checkpoint_path, json.dumps(checkpoint).encode())
+
+    def clear_checkpoint(self):
+        try:
+            os.remove(self.checkpoint_path)
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        """
+        Remove the checkpoint and the pages of the table (after a successful synchronization)
+        """
+        self.clear_checkpoint()
+        shutil.rmtree(self.pages_path, ignore_errors=True)
+        self.prune()
+
+    def prune(self):
+        """
+        Remove the objects which are not referenced by any page
+        """
+        referenced = set()
+        for directory, _, names in os.walk(os.path.join(self.root, "pages")):
+            for name in names:
+                try:
+                    with open(os.path.join(directory, name)) as page:
+                        referenced.add(page.read().strip())
+                except OSError:
+                    pass
+        limit = time.time() - PRUNE_GRACE_PERIOD
+        for directory, _, names in os.walk(os.path.join(self.root, "objects")):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    if name[:-5] not in referenced and os.path.getmtime(path) < limit:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def log_resume(self):
+        checkpoint = self.get_checkpoint()
+        if checkpoint and checkpoint["version"] == self.version:
+            logger.info(f"Resuming {self.table_name} from the cached pages up to {checkpoint['offset']}")
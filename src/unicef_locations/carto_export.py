@@ -0,0 +1,136 @@
+"""
+Bulk fetch of a Carto table through a single streamed SQL API export (``format=csv`` or ``format=geojson``),
+instead of one request per page of ``cartodb_id``: rows are parsed incrementally as the bytes arrive.
+"""
+
+import codecs
+import csv
+import json
+import re
+from itertools import chain
+
+from carto.exceptions import CartoException
+from pyrestcli import exceptions
+
+CSV, GEOJSON = "csv", "geojson"
+SQL_API_PATH = "api/v2/sql"
+CHUNK_SIZE = 64 * 1024
+
+ITEM_START = re.compile(r"[^\s,]")
+STRUCTURE_TOKENS = re.compile(r'[{}\[\]"]')
+STRING_TOKENS = re.compile(r'["\\]')
+
+
+def send_export(auth_client, query, export_format):
+    response = auth_client.send(SQL_API_PATH, "GET", params={"q": query, "format": export_format}, stream=True)
+    if response.status_code >= 400:
+        try:
+            # the pyrestcli exception of the status (as raised by SQLClient.send), read by the retry policy
+            exceptions.BaseException.create(response)
+        except exceptions.BaseException as e:
+            raise CartoException(e)
+        finally:
+            response.close()
+    return response
+
+
+def iter_lines(chunks):
+    """
+    Lines of the text received in `chunks`, with their line endings (needed by csv for the quoted newlines)
+    """
+    pending = ""
+    for chunk in chunks:
+        lines = (pending + chunk).splitlines(keepends=True)
+        pending = lines.pop() if lines and not lines[-1].endswith(("\n", "\r")) else ""
+        yield from lines
+    if pending:
+        yield pending
+
+
+def iter_csv_rows(response):
+    """
+    Rows of a CSV export, empty values are returned as None (as the JSON responses do)
+    """
+    chunks = codecs.iterdecode(response.iter_content(CHUNK_SIZE), "utf-8")
+    for row in csv.DictReader(iter_lines(chunks)):
+        yield {key: value if value != "" else None for key, value in row.items()}
+
+
+def iter_json_array(chunks, key):
+    """
+    Items (objects or arrays) of the `key` array of a JSON document received in `chunks` of text,
+    decoded one by one as soon as they are complete (e.g. the features of a GeoJSON FeatureCollection).
+    The chunks are scanned once for the structure, each item is decoded once.
+    """
+    chunks = iter(chunks)
+    marker, head = f'"{key}"', ""
+    for chunk in chunks:
+        head += chunk
+        start = head.find(marker)
+        start = head.find("[", start + len(marker)) if start >= 0 else -1
+        if start >= 0:
+            break
+    else:
+        raise ValueError(f"Invalid JSON export, no {key} array")
+
+    parts, depth, in_string, position, item_start = [], 0, False, start + 1, 0
+    for chunk in chain([head], chunks):
+        while position < len(chunk):
+            if not depth:
+                match = ITEM_START.search(chunk, position)
+                if not match:
+                    position = len(chunk)
+                    break
+                if match.group() == "]":
+                    return
+                if match.group() not in "{[":
+                    raise ValueError(f"Invalid JSON export, unexpected {match.group()} in the {key} array")
+                item_start, position, depth = match.start(), match.end(), 1
+            elif in_string:
+                match = STRING_TOKENS.search(chunk, position)
+                if not match:
+                    position = len(chunk)
+                elif match.group() == "\\":
+                    position = match.end() + 1  # the escaped character may be in the next chunk
+                else:
+                    position, in_string = match.end(), False
+            else:
+                match = STRUCTURE_TOKENS.search(chunk, position)
+                if not match:
+                    position = len(chunk)
+                    break
+                position = match.end()
+                if match.group() == '"':
+                    in_string = True
+                elif match.group() in "{[":
+                    depth += 1
+                else:
+                    depth -= 1
+                    if not depth:
+                        parts.append(chunk[item_start:position])
+                        yield json.loads("".join(parts))
+                        parts = []
+        if depth:
+            parts.append(chunk[item_start:])
+        item_start, position = 0, position - len(chunk)
+    raise ValueError(f"Truncated or invalid JSON export, the {key} array is not terminated")
+
+
+def iter_geojson_rows(response):
+    """
+    Rows of a GeoJSON export, with the geometry of each feature as a GeoJSON string in ``the_geom``
+    """
+    chunks = codecs.iterdecode(response.iter_content(CHUNK_SIZE), "utf-8")
+    for feature in iter_json_array(chunks, "features"):
+        geometry = feature.get("geometry")
+        yield {**(feature.get("properties") or {}), "the_geom": json.dumps(geometry) if geometry else None}
+
+
+def fetch_export(auth_client, query, export_format):
+    """
+    All the rows of `query`, fetched with a single streamed export
+    """
+    response = send_export(auth_client, query, export_format)
+    with response:
+        rows = iter_csv_rows(response) if export_format == CSV else iter_geojson_rows(response)
+        return list(rows)
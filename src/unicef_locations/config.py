@@ -7,6 +7,30 @@ class AppSettings:
     defaults = {
         "GET_CACHE_KEY": "unicef_locations.cache.get_cache_key",
         "CACHE_VERSION_KEY": "locations-etag-version",
+        "GEOMETRY_PIECE_MAX_VERTICES": 256,
+        "BULK_LOOKUP_MAX_KEYS": 50000,
+        "EXPORT_CHUNK_SIZE": 2000,
+        "SNAPSHOT_MODE": None,  # None (disabled), "redirect" or "x-accel"
+        "SNAPSHOT_STORAGE": None,  # storage class path, default_storage when not set
+        "SNAPSHOT_PATH": "locations/snapshots",
+        "SNAPSHOT_ACCEL_PREFIX": "/protected/",
+        "SNAPSHOT_GEOJSON": False,
+        # ST_SimplifyPreserveTopology tolerance (degrees) of the stored geometries, by resolution
+        "SIMPLIFY_TOLERANCES": {"coarse": 0.01, "medium": 0.001, "fine": 0.0001},
+        "PREPROCESS_WORKERS": None,  # geometry preprocessing processes, os.cpu_count() when not set
+        "PREPROCESS_BATCH_SIZE": 1000,
+        "IMPORT_DISTRIBUTED": False,  # import_locations fans out the fetch and preprocessing over celery workers
+        "IMPORT_CHUNK_SIZE": 5000,  # cartodb_id range of a fetch subtask of the distributed import
+        "CARTO_CACHE_DIR": None,  # directory of the on-disk cache of the Carto pages, disabled when not set
+        "CARTO_POOL_MAXSIZE": 10,  # connections to a Carto domain, per process
+        "CARTO_CONNECT_TIMEOUT": 10,  # seconds
+        "CARTO_READ_TIMEOUT": 120,  # seconds without receiving data
+        "CARTO_RETRY_POLICY": "unicef_locations.retry.RetryPolicy",
+        "CARTO_RETRY_MAX_ATTEMPTS": 5,
+        "CARTO_RETRY_BASE_DELAY": 0.5,  # seconds, doubled at each retry (with jitter)
+        "CARTO_RETRY_MAX_DELAY": 30,
+        "CARTO_CIRCUIT_FAILURE_THRESHOLD": 5,  # consecutive failures opening the circuit of a Carto domain
+        "CARTO_CIRCUIT_RESET_TIMEOUT": 60,  # seconds before a trial request is let through
     }
 
     def __init__(self, prefix):
@@ -32,7 +56,7 @@ class AppSettings:
     def _set_attr(self, prefix_name, value):
         fr = len(self.prefix) + 1
         name = prefix_name[fr:]
-        if name in ("GET_CACHE_KEY", "GET_CACHE_VERSION"):
+        if name in ("GET_CACHE_KEY", "GET_CACHE_VERSION", "CARTO_RETRY_POLICY"):
             try:
                 if isinstance(value, str):
                     func = get_callable(value)
@@ -3,3 +3,7 @@ from carto.exceptions import CartoException
 
 class InvalidRemap(CartoException):
     pass
+
+
+class CircuitOpen(CartoException):
+    pass
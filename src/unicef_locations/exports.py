@@ -0,0 +1,114 @@
+"""
+Constant-memory exports of locations: rows are read through a server-side cursor,
+serialized chunk by chunk and written (or yielded) as soon as they are ready.
+"""
+
+import csv
+import json
+from itertools import islice
+
+from .config import conf
+from .geometry import get_geometry_field, SIMPLIFIED_GEOMETRY_FIELDS
+from .serializers import LocationExportFlatSerializer, LocationExportPropertiesSerializer
+from .utils import get_location_model
+
+try:
+    import fiona
+except ImportError:  # pragma: no cover
+    fiona = None
+
+CSV, GEOJSON, GEOPACKAGE = "csv", "geojson", "gpkg"
+EXPORT_FORMATS = (CSV, GEOJSON, GEOPACKAGE)
+CONTENT_TYPES = {
+    CSV: "text/csv",
+    GEOJSON: "application/geo+json-seq",
+    GEOPACKAGE: "application/geopackage+sqlite3",
+}
+
+
+def get_export_queryset():
+    return get_location_model().objects.select_related(None).order_by("tree_id", "lft")
+
+
+def iter_chunks(queryset, serializer_class):
+    """
+    Yields the serialized locations of `queryset`, one chunk of EXPORT_CHUNK_SIZE rows at a time
+    """
+    rows = queryset.iterator(chunk_size=conf.EXPORT_CHUNK_SIZE)
+    while True:
+        chunk = list(islice(rows, conf.EXPORT_CHUNK_SIZE))
+        if not chunk:
+            return
+        yield chunk, serializer_class(chunk, many=True).data
+
+
+class Echo:
+    """
+    File-like object returning what is written, to stream the output of csv.writer
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(queryset):
+    """
+    Yields the CSV lines of the flat export (geometries exported as their representative point)
+    """
+    writer = csv.writer(Echo())
+    fields = list(LocationExportFlatSerializer().fields)
+    yield writer.writerow(fields)
+    for __, data in iter_chunks(queryset.lean(), LocationExportFlatSerializer):
+        for row in data:
+            yield writer.writerow([row[field] for field in fields])
+
+
+def get_feature_geometry(location, resolution=None):
+    geometry = getattr(location, get_geometry_field(resolution)) or location.point
+    return json.loads(geometry.json) if geometry else None
+
+
+def iter_features(queryset, resolution=None):
+    """
+    Yields the GeoJSON features of the locations, with their geometry simplified at `resolution` if given
+    """
+    field = get_geometry_field(resolution)
+    queryset = queryset.defer(*(name for name in ("geom", *SIMPLIFIED_GEOMETRY_FIELDS) if name != field))
+    for locations, data in iter_chunks(queryset, LocationExportPropertiesSerializer):
+        for location, properties in zip(locations, data):
+            yield {
+                "type": "Feature",
+                "id": location.pk,
+                "geometry": get_feature_geometry(location, resolution),
+                "properties": properties,
+            }
+
+
+def iter_geojson(queryset, resolution=None):
+    """
+    Yields newline-delimited GeoJSON features
+    """
+    for feature in iter_features(queryset, resolution):
+        yield json.dumps(feature, default=str) + "\n"
+
+
+def write_geopackage(queryset, path, layer="locations", resolution=None):
+    """
+    Writes the locations in a GeoPackage layer, requires the optional `fiona` package
+    """
+    if fiona is None:  # pragma: no cover
+        raise RuntimeError("The GeoPackage export requires the fiona package")
+
+    properties = {name: "str" for name in LocationExportPropertiesSerializer().fields}
+    schema = {"geometry": "Unknown", "properties": properties}
+    with fiona.open(path, "w", driver="GPKG", layer=layer, schema=schema, crs="EPSG:4326") as dst:
+        batch = []
+        for feature in iter_features(queryset, resolution):
+            feature["properties"] = {
+                name: None if value is None else str(value) for name, value in feature["properties"].items()
+            }
+            batch.append(fiona.Feature.from_dict(feature))
+            if len(batch) >= conf.EXPORT_CHUNK_SIZE:
+                dst.writerecords(batch)
+                batch = []
+        dst.writerecords(batch)
@@ -0,0 +1,104 @@
+import math
+
+from django.contrib.gis.geos import Polygon
+from django.db.models import Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .ancestry import filter_by_ancestor
+from .geometry import bbox_envelope
+from .utils import get_location_model
+
+
+def parse_int(name, value):
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: "Value must be an integer"})
+
+
+def parse_int_list(name, value):
+    try:
+        return [int(x) for x in value.split(",") if x]
+    except ValueError:
+        raise ValidationError({name: "Values must be integers"})
+
+
+def parse_boolean(name, value):
+    if value.lower() in ("1", "true", "yes"):
+        return True
+    if value.lower() in ("0", "false", "no"):
+        return False
+    raise ValidationError({name: "Value must be a boolean"})
+
+
+class LocationFilterBackend(BaseFilterBackend):
+    """
+    Filters locations on:
+
+        ?admin_level=1,2
+        ?parent=<id>|null
+        ?is_active=true|false
+        ?subtree=<id>                         the location and all its descendants (MPTT range)
+        ?ancestor=<p_code>                    the active location and all its descendants (ancestry path prefix)
+        ?modified__gt=<ISO 8601 datetime>
+        ?bbox=<xmin>,<ymin>,<xmax>,<ymax>     locations overlapping the bounding box
+        ?is_valid=true|false                  locations with a valid / broken geometry
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        if params.get("admin_level"):
+            queryset = queryset.filter(admin_level__in=parse_int_list("admin_level", params["admin_level"]))
+
+        if params.get("parent"):
+            if params["parent"].lower() == "null":
+                queryset = queryset.filter(parent__isnull=True)
+            else:
+                queryset = queryset.filter(parent__in=parse_int_list("parent", params["parent"]))
+
+        if params.get("is_active"):
+            queryset = queryset.filter(is_active=parse_boolean("is_active", params["is_active"]))
+
+        if params.get("subtree"):
+            root = get_location_model().objects.filter(pk=parse_int("subtree", params["subtree"])).order_by()
+            queryset = queryset.filter(
+                tree_id=Subquery(root.values("tree_id")),
+                lft__gte=Subquery(root.values("lft")),
+                rght__lte=Subquery(root.values("rght")),
+            )
+
+        if params.get("ancestor"):
+            queryset = filter_by_ancestor(queryset, params["ancestor"])
+
+        if params.get("modified__gt"):
+            try:
+                # None when not well formatted, ValueError when out of range (e.g. 2024-02-30)
+                modified = parse_datetime(params["modified__gt"])
+            except ValueError:
+                modified = None
+            if modified is None:
+                raise ValidationError({"modified__gt": "Value must be an ISO 8601 datetime"})
+            if timezone.is_naive(modified):
+                modified = timezone.make_aware(modified)
+            queryset = queryset.filter(modified__gt=modified)
+
+        if params.get("bbox"):
+            try:
+                xmin, ymin, xmax, ymax = (float(x) for x in params["bbox"].split(","))
+            except ValueError:
+                raise ValidationError({"bbox": "Value must be xmin,ymin,xmax,ymax"})
+            if not all(map(math.isfinite, (xmin, ymin, xmax, ymax))) or xmin > xmax or ymin > ymax:
+                raise ValidationError({"bbox": "Value must be xmin,ymin,xmax,ymax"})
+            bbox = Polygon.from_bbox((xmin, ymin, xmax, ymax))
+            bbox.srid = 4326
+            # stored envelopes (see geometry.refresh_geometry_metadata), geometries are not read
+            queryset = queryset.alias(bbox_envelope=bbox_envelope()).filter(bbox_envelope__bboverlaps=bbox)
+
+        if params.get("is_valid"):
+            queryset = queryset.filter(is_valid=parse_boolean("is_valid", params["is_valid"]))
+
+        return queryset
@@ -5,8 +5,9 @@ from carto.sql import SQLClient
 from django import forms
 from django.core.exceptions import ValidationError
 
-from .auth import LocationsCartoNoAuthClient
+from .auth import get_carto_client
 from .models import CartoDBTable
+from .retry import get_retry_policy
 
 logger = logging.getLogger(__name__)
 
@@ -23,11 +24,11 @@ class CartoDBTableForm(forms.ModelForm):
         pcode_col = self.cleaned_data["pcode_col"]
         parent_code_col = self.cleaned_data["parent_code_col"]
         remap_table_name = self.cleaned_data["remap_table_name"]
-        auth_client = LocationsCartoNoAuthClient(base_url="https://{}.carto.com/".format(str(domain)))
-
-        sql_client = SQLClient(auth_client)
+        sql_client = SQLClient(get_carto_client(str(domain)))
+        # short retries, the user is waiting
+        retry_policy = get_retry_policy(max_attempts=2, max_delay=1)
         try:
-            sites = sql_client.send("select * from {} limit 1".format(table_name))
+            sites = retry_policy.call(str(domain), sql_client.send, "select * from {} limit 1".format(table_name))
         except CartoException:
             logger.exception("CartoDB exception occured")
             raise ValidationError("Couldn't connect to CartoDB table: {}".format(table_name))
@@ -44,7 +45,9 @@ class CartoDBTableForm(forms.ModelForm):
 
         if remap_table_name:
             try:
-                remap_table = sql_client.send("select * from {} limit 1".format(remap_table_name))
+                remap_table = retry_policy.call(
+                    str(domain), sql_client.send, "select * from {} limit 1".format(remap_table_name)
+                )
             except CartoException:  # pragma: no-cover
                 logger.exception("CartoDB exception occured")
                 raise ValidationError("Couldn't connect to the CartoDB remap table: {}".format(remap_table_name))
@@ -0,0 +1,228 @@
+"""
+Maintenance of the data derived from the location geometries.
+
+Derived data is refreshed in set-based SQL, either for a single location right after
+it is saved, or in bulk (e.g. at the end of a synchronization) through `refresh_geometries`.
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.db.models.functions import GeoFunc, IsValid, MakeValid, PointOnSurface
+from django.db import connection
+from django.db.models import FloatField, Func
+from django.db.models.functions import Coalesce
+
+from .config import conf
+from .utils import get_location_model
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+# stored topology-preserving simplifications of geom, from the coarsest to the finest
+RESOLUTIONS = ("coarse", "medium", "fine")
+SIMPLIFIED_GEOMETRY_FIELDS = tuple(f"geom_{resolution}" for resolution in RESOLUTIONS)
+
+
+class SimplifyPreserveTopology(GeoFunc):
+    function = "ST_SimplifyPreserveTopology"
+    arity = 2
+
+
+class Multi(GeoFunc):
+    function = "ST_Multi"
+    arity = 1
+
+
+class CollectionExtract(GeoFunc):
+    function = "ST_CollectionExtract"
+    arity = 2
+
+
+class GeographyArea(Func):
+    template = "ST_Area(%(expressions)s::geography)"
+    output_field = FloatField()
+
+
+class XMin(Func):
+    function = "ST_XMin"
+    output_field = FloatField()
+
+
+class YMin(Func):
+    function = "ST_YMin"
+    output_field = FloatField()
+
+
+class XMax(Func):
+    function = "ST_XMax"
+    output_field = FloatField()
+
+
+class YMax(Func):
+    function = "ST_YMax"
+    output_field = FloatField()
+
+
+class MakeEnvelope(Func):
+    function = "ST_MakeEnvelope"
+    output_field = GeometryField(srid=4326)
+
+
+def bbox_envelope():
+    """
+    Stored bounding box as a rectangle, the expression of the GiST index used by the bbox filter
+    """
+    return MakeEnvelope("bbox_xmin", "bbox_ymin", "bbox_xmax", "bbox_ymax", 4326)
+
+
+def get_resolution(params):
+    """
+    Resolution requested by the ``resolution`` (or ``simplify``) parameter, None for the full geometry.
+    Raises ValueError if it is unknown.
+    """
+    value = params.get("resolution") or params.get("simplify")
+    if not value or value == "full":
+        return None
+    if value not in RESOLUTIONS:
+        raise ValueError("Must be one of full, {}".format(", ".join(RESOLUTIONS)))
+    return value
+
+
+def get_geometry_field(resolution=None):
+    """
+    Name of the column storing the geometry at `resolution`, the full geometry when it's None
+    """
+    return f"geom_{resolution}" if resolution else "geom"
+
+
+@contextmanager
+def defer_geometry_refresh():
+    """
+    Skip the refresh of the derived geometry data (and of the descendants' ancestry paths) on every
+    save: bulk operations refresh all the touched locations at once when they are done.
+    """
+    previous = geometry_refresh_deferred()
+    _state.deferred = True
+    try:
+        yield
+    finally:
+        _state.deferred = previous
+
+
+def geometry_refresh_deferred():
+    return getattr(_state, "deferred", False)
+
+
+def refresh_geometry_pieces(queryset):
+    """
+    Rebuild the subdivided pieces (at most GEOMETRY_PIECE_MAX_VERTICES vertices each)
+    of the geometries of the locations in `queryset`.
+    """
+    piece_model = apps.get_model("unicef_locations", "LocationGeometryPiece")
+    piece_table = connection.ops.quote_name(piece_model._meta.db_table)
+    location_table = connection.ops.quote_name(get_location_model()._meta.db_table)
+    ids_sql, ids_params = queryset.order_by().values("pk").query.sql_with_params()
+
+    piece_model.objects.filter(location__in=queryset.order_by().values("pk")).delete()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {piece_table} (location_id, geom) "
+            f"SELECT id, ST_Subdivide(geom, %s) FROM {location_table} "
+            f"WHERE geom IS NOT NULL AND id IN ({ids_sql})",
+            (conf.GEOMETRY_PIECE_MAX_VERTICES, *ids_params),
+        )
+        logger.info(f"Created {cursor.rowcount} geometry pieces")
+
+
+def locate_points(points, admin_level):
+    """
+    Active locations of `admin_level` containing each of the WKB `points` (None are not located),
+    found with a single spatial join against the indexed geometry pieces.
+    Returns, for every point, the list of the ids of the locations containing it.
+    """
+    located = [[] for __ in points]
+    indexes = [i for i, point in enumerate(points) if point is not None]
+    if not indexes:
+        return located
+
+    piece_model = apps.get_model("unicef_locations", "LocationGeometryPiece")
+    piece_table = connection.ops.quote_name(piece_model._meta.db_table)
+    location_table = connection.ops.quote_name(get_location_model()._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT DISTINCT points.i, pieces.location_id "
+            f"FROM unnest(%s::integer[], %s::bytea[]) AS points (i, wkb) "
+            f"JOIN {piece_table} pieces "
+            f"ON ST_Intersects(pieces.geom, ST_SetSRID(ST_GeomFromWKB(points.wkb), 4326)) "
+            f"JOIN {location_table} locations ON locations.id = pieces.location_id "
+            f"WHERE locations.is_active AND locations.admin_level = %s",
+            (indexes, [bytes(points[i]) for i in indexes], admin_level),
+        )
+        for i, location_id in cursor.fetchall():
+            located[i].append(location_id)
+    return located
+
+
+def refresh_representative_points(queryset):
+    """
+    Store the point on surface of the geometries, so that it's never computed when serving locations
+    """
+    updated = queryset.order_by().update(representative_point=PointOnSurface("geom"))
+    logger.info(f"Refreshed {updated} representative points")
+
+
+def refresh_simplified_geometries(queryset):
+    """
+    Store the geometries simplified with the SIMPLIFY_TOLERANCES of every resolution
+    """
+    updated = queryset.order_by().update(
+        **{
+            get_geometry_field(resolution): Multi(
+                SimplifyPreserveTopology("geom", conf.SIMPLIFY_TOLERANCES[resolution])
+            )
+            for resolution in RESOLUTIONS
+        }
+    )
+    logger.info(f"Refreshed {updated} simplified geometries")
+
+
+def refresh_geometry_metadata(queryset):
+    """
+    Store the bounding box (of geom, or of the point), the area in square meters and the validity of the geometries
+    """
+    shape = Coalesce("geom", "point", output_field=GeometryField(srid=4326))
+    updated = queryset.order_by().update(
+        bbox_xmin=XMin(shape),
+        bbox_ymin=YMin(shape),
+        bbox_xmax=XMax(shape),
+        bbox_ymax=YMax(shape),
+        area=GeographyArea("geom"),
+        is_valid=IsValid("geom"),
+    )
+    logger.info(f"Refreshed {updated} geometry bounding boxes, areas and validity")
+
+
+def repair_geometries(queryset):
+    """
+    Replace the invalid geometries of `queryset` with their polygonal part once made valid (ST_MakeValid).
+    Returns the number of repaired geometries.
+    """
+    invalid = queryset.order_by().annotate(valid=IsValid("geom")).filter(valid=False)
+    repaired = invalid.update(geom=Multi(CollectionExtract(MakeValid("geom"), 3)))
+    logger.info(f"Repaired {repaired} invalid geometries")
+    return repaired
+
+
+def refresh_geometries(queryset):
+    """
+    Refresh all the data derived from the geometries of the locations in `queryset`.
+    """
+    refresh_representative_points(queryset)
+    refresh_simplified_geometries(queryset)
+    refresh_geometry_metadata(queryset)
+    refresh_geometry_pieces(queryset)
@@ -0,0 +1,154 @@
+"""
+In-memory spatial index of location polygons, used by batch jobs that need to
+assign large amounts of points to locations without a database round trip per point.
+
+Requires the optional ``numpy`` and ``shapely>=2`` packages (``pip install unicef-locations[index]``).
+"""
+
+import logging
+
+import numpy as np
+import shapely
+
+from .cache import get_cache_version
+from .utils import get_location_model
+
+logger = logging.getLogger(__name__)
+
+NOT_FOUND = -1
+
+# safety net for degenerate geometries that cannot be split below `max_vertices`
+MAX_SUBDIVIDE_DEPTH = 32
+
+
+def subdivide(geometries, max_vertices):
+    """
+    Recursively split each geometry in halves along the longest side of its bounding box
+    until every piece has at most `max_vertices` coordinates.
+
+    Returns the pieces and, for every piece, the index of the geometry it comes from.
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    owners = np.arange(len(geometries))
+    pieces, piece_owners = [], []
+
+    for __ in range(MAX_SUBDIVIDE_DEPTH):
+        small = shapely.get_num_coordinates(geometries) <= max_vertices
+        pieces.append(geometries[small])
+        piece_owners.append(owners[small])
+        geometries, owners = geometries[~small], owners[~small]
+        if not len(geometries):
+            break
+
+        xmin, ymin, xmax, ymax = shapely.bounds(geometries).T
+        wide = (xmax - xmin) >= (ymax - ymin)
+        xmid, ymid = (xmin + xmax) / 2, (ymin + ymax) / 2
+        first = shapely.intersection(
+            geometries, shapely.box(xmin, ymin, np.where(wide, xmid, xmax), np.where(wide, ymax, ymid))
+        )
+        second = shapely.intersection(
+            geometries, shapely.box(np.where(wide, xmid, xmin), np.where(wide, ymin, ymid), xmax, ymax)
+        )
+
+        geometries = np.concatenate([first, second])
+        owners = np.concatenate([owners, owners])
+        not_empty = ~shapely.is_empty(geometries)
+        geometries, owners = geometries[not_empty], owners[not_empty]
+
+    pieces.append(geometries)
+    piece_owners.append(owners)
+    return np.concatenate(pieces), np.concatenate(piece_owners)
+
+
+class LocationIndex:
+    """
+    STRtree of prepared geometries of the active locations at the given admin levels.
+
+        index = LocationIndex(admin_levels=[1, 2])
+        location_ids = index.locate(np.array([[lon, lat], ...]))
+
+    Geometries can optionally be simplified (`simplify_tolerance`, in degrees) and/or
+    subdivided in pieces of at most `max_vertices` coordinates, which makes each
+    containment test cheaper. The index is reloaded automatically when the locations
+    cache version changes.
+    """
+
+    def __init__(self, admin_levels=None, simplify_tolerance=None, max_vertices=None):
+        self.admin_levels = list(admin_levels) if admin_levels is not None else None
+        self.simplify_tolerance = simplify_tolerance
+        self.max_vertices = max_vertices
+        self.version = None
+        self.tree = None
+        self.geometries = np.empty(0, dtype=object)
+        self.location_ids = np.empty(0, dtype=np.int64)
+        self.location_levels = np.empty(0, dtype=np.int64)
+
+    def get_queryset(self):
+        qs = get_location_model().objects.filter(is_active=True, geom__isnull=False)
+        if self.admin_levels is not None:
+            qs = qs.filter(admin_level__in=self.admin_levels)
+        return qs.select_related(None).order_by()
+
+    def load(self):
+        version = get_cache_version()
+        ids, levels, wkbs = [], [], []
+        for pk, admin_level, geom in self.get_queryset().values_list("pk", "admin_level", "geom").iterator():
+            ids.append(pk)
+            levels.append(-1 if admin_level is None else admin_level)
+            wkbs.append(bytes(geom.wkb))
+
+        geometries = shapely.from_wkb(wkbs) if wkbs else np.empty(0, dtype=object)
+        if self.simplify_tolerance:
+            geometries = shapely.simplify(geometries, self.simplify_tolerance, preserve_topology=True)
+        owners = np.arange(len(geometries))
+        if self.max_vertices:
+            geometries, owners = subdivide(geometries, self.max_vertices)
+        shapely.prepare(geometries)
+
+        self.geometries = geometries
+        self.location_ids = np.asarray(ids, dtype=np.int64)[owners]
+        self.location_levels = np.asarray(levels, dtype=np.int64)[owners]
+        self.tree = shapely.STRtree(geometries)
+        self.version = version
+        logger.info(f"Loaded {len(ids)} locations in {len(geometries)} pieces into the spatial index")
+
+    def ensure_loaded(self):
+        if self.tree is None or self.version != get_cache_version():
+            self.load()
+
+    def _covering(self, coords):
+        """
+        Returns the (point index, piece index) pairs where the piece covers the point:
+        candidates come from the tree bounding boxes, the exact test runs on the prepared pieces.
+        """
+        self.ensure_loaded()
+        points = shapely.points(coords)
+        point_idx, geom_idx = self.tree.query(points)
+        hits = shapely.covers(self.geometries[geom_idx], points[point_idx])
+        return point_idx[hits], geom_idx[hits]
+
+    def query(self, coords):
+        """
+        Returns all the (point index, location id) pairs where the location covers the point.
+        `coords` is an array of shape (n, 2) of longitude/latitude.
+        """
+        point_idx, geom_idx = self._covering(np.asarray(coords, dtype=float).reshape(-1, 2))
+
+        # pieces of the same location can both cover a point lying on the cut line
+        pairs = np.unique(np.stack([point_idx, self.location_ids[geom_idx]], axis=1), axis=0)
+        return pairs[:, 0], pairs[:, 1]
+
+    def locate(self, coords):
+        """
+        Returns one location id for every point, NOT_FOUND when no location covers it.
+        When locations from several admin levels cover a point, the deepest level wins.
+        """
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        result = np.full(len(coords), NOT_FOUND, dtype=np.int64)
+
+        point_idx, geom_idx = self._covering(coords)
+        order = np.lexsort((-self.location_levels[geom_idx], point_idx))
+        point_idx, geom_idx = point_idx[order], geom_idx[order]
+        first_points, first = np.unique(point_idx, return_index=True)
+        result[first_points] = self.location_ids[geom_idx[first]]
+        return result
@@ -0,0 +1,41 @@
+from django.core.management import BaseCommand, CommandError
+
+from unicef_locations import exports
+from unicef_locations.geometry import RESOLUTIONS
+
+
+class Command(BaseCommand):
+    help = "Export locations to CSV, newline-delimited GeoJSON or GeoPackage without loading them in memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="output file, '-' for stdout (not available for GeoPackage)")
+        parser.add_argument("--format", choices=exports.EXPORT_FORMATS, default=exports.CSV, dest="export_format")
+        parser.add_argument("--admin-level", type=int, action="append", dest="admin_levels", default=None)
+        parser.add_argument("--active", action="store_true", help="export only active locations")
+        parser.add_argument(
+            "--resolution", choices=RESOLUTIONS, default=None, help="export the stored simplified geometries"
+        )
+
+    def handle(self, *args, path, export_format, admin_levels, active, resolution, **options):
+        queryset = exports.get_export_queryset()
+        if admin_levels:
+            queryset = queryset.filter(admin_level__in=admin_levels)
+        if active:
+            queryset = queryset.filter(is_active=True)
+
+        if export_format == exports.GEOPACKAGE:
+            if path == "-":
+                raise CommandError("GeoPackage cannot be written to stdout")
+            exports.write_geopackage(queryset, path, resolution=resolution)
+            return
+
+        if export_format == exports.CSV:
+            iterator = exports.iter_csv(queryset)
+        else:
+            iterator = exports.iter_geojson(queryset, resolution)
+        if path == "-":
+            for line in iterator:
+                self.stdout.write(line, ending="")
+        else:
+            with open(path, "w", newline="") as output:
+                output.writelines(iterator)
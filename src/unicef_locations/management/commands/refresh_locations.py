@@ -0,0 +1,26 @@
+from django.core.management import BaseCommand
+
+from unicef_locations.ancestry import refresh_ancestry
+from unicef_locations.cache import invalidate_cache
+from unicef_locations.geometry import refresh_geometries, repair_geometries
+from unicef_locations.utils import get_location_model
+
+
+class Command(BaseCommand):
+    help = "Rebuild the data derived from the locations (e.g. after a bulk load or an upgrade)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--admin-level", type=int, action="append", dest="admin_levels", default=None)
+        parser.add_argument("--repair", action="store_true", help="make the invalid geometries valid first")
+
+    def handle(self, *args, **options):
+        qs = get_location_model().objects.all()
+        if options["admin_levels"]:
+            qs = qs.filter(admin_level__in=options["admin_levels"])
+        if options["repair"]:
+            repair_geometries(qs)
+        refresh_geometries(qs)
+        refresh_ancestry(qs)
+        # the bulk updates do not send post_save, the cached responses are outdated
+        invalidate_cache()
+        self.stdout.write(f"Refreshed geometries and ancestry of {qs.count()} locations")
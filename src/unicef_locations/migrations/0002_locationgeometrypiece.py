@@ -0,0 +1,26 @@
+import django.contrib.gis.db.models.fields
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.UNICEF_LOCATIONS_MODEL),
+        ('unicef_locations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationGeometryPiece',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('geom', django.contrib.gis.db.models.fields.PolygonField(srid=4326, verbose_name='Geometry')),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='geometry_pieces', to=settings.UNICEF_LOCATIONS_MODEL, verbose_name='Location')),
+            ],
+            options={
+                'verbose_name': 'Location Geometry Piece',
+            },
+        ),
+    ]
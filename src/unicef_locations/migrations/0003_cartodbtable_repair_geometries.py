@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicef_locations', '0002_locationgeometrypiece'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartodbtable',
+            name='repair_geometries',
+            field=models.BooleanField(default=False, help_text='Make the invalid imported geometries valid (ST_MakeValid)', verbose_name='Repair Geometries'),
+        ),
+    ]
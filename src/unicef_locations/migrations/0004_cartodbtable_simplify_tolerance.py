@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicef_locations', '0003_cartodbtable_repair_geometries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartodbtable',
+            name='simplify_tolerance',
+            field=models.FloatField(blank=True, help_text='Simplify the imported geometries (topology preserving), in degrees', null=True, verbose_name='Simplify Tolerance'),
+        ),
+    ]
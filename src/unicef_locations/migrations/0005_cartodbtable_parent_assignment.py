@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicef_locations', '0004_cartodbtable_simplify_tolerance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartodbtable',
+            name='parent_assignment',
+            field=models.CharField(choices=[('code', 'Parent code column'), ('spatial', 'Spatial (representative point within the parent level geometries)')], default='code', max_length=16, verbose_name='Parent Assignment'),
+        ),
+    ]
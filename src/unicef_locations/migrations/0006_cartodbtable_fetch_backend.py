@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicef_locations', '0005_cartodbtable_parent_assignment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartodbtable',
+            name='fetch_backend',
+            field=models.CharField(choices=[('paginated', 'Paginated SQL API requests'), ('csv', 'Streamed CSV export'), ('geojson', 'Streamed GeoJSON export')], default='paginated', help_text='How the rows are fetched from Carto, the streamed exports fall back to paginated requests', max_length=16, verbose_name='Fetch Backend'),
+        ),
+    ]
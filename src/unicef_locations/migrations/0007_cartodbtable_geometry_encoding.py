@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('unicef_locations', '0006_cartodbtable_fetch_backend'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartodbtable',
+            name='geometry_encoding',
+            field=models.CharField(choices=[('geojson', 'GeoJSON'), ('wkb', 'Hex WKB'), ('twkb', 'TWKB')], default='geojson', help_text='Encoding of the geometries transferred from Carto (not used by the GeoJSON export)', max_length=16, verbose_name='Geometry Encoding'),
+        ),
+        migrations.AddField(
+            model_name='cartodbtable',
+            name='geometry_precision',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Decimal digits of the transferred coordinates (GeoJSON and TWKB), full precision if empty', null=True, verbose_name='Geometry Precision'),
+        ),
+    ]
@@ -2,6 +2,7 @@ import logging
 
 from django.conf import settings
 from django.contrib.gis.db import models
+from django.contrib.postgres.indexes import GistIndex
 from django.db.models.signals import post_delete, post_save
 from django.dispatch.dispatcher import receiver
 from django.utils.translation import gettext as _
@@ -9,8 +10,19 @@ from model_utils.fields import AutoCreatedField, AutoLastModifiedField
 from model_utils.models import TimeStampedModel
 from mptt.managers import TreeManager
 from mptt.models import MPTTModel, TreeForeignKey
+from mptt.querysets import TreeQuerySet
 
-from .cache import invalidate_cache
+from .ancestry import (
+    DERIVED_FIELDS,
+    format_display_name,
+    format_full_name,
+    NAME_SEPARATOR,
+    PCODE_SEPARATOR,
+    refresh_ancestry,
+    SOURCE_FIELDS,
+)
+from .cache import invalidate_cache_on_commit
+from .geometry import bbox_envelope, geometry_refresh_deferred, refresh_geometries, SIMPLIFIED_GEOMETRY_FIELDS
 from .libs import get_random_color
 
 logger = logging.getLogger(__name__)
@@ -32,7 +44,29 @@ class GatewayType(TimeStampedModel):
         return self.name
 
 
-class LocationsManager(TreeManager):
+class LocationsQuerySet(TreeQuerySet):
+    # geometries too heavy to be loaded when they are not rendered
+    deferred_geometry_fields = ("geom", *SIMPLIFIED_GEOMETRY_FIELDS)
+
+    def lean(self):
+        """
+        Locations without the parent join and with the geometries deferred
+        """
+        return self.select_related(None).defer(*self.deferred_geometry_fields)
+
+    def with_parent_name(self):
+        """
+        Locations joined with the name of their parent only, with the geometries deferred
+        """
+        parent_fields = [
+            f"parent__{field.name}"
+            for field in self.model._meta.concrete_fields
+            if not field.primary_key and field.name != "name"
+        ]
+        return self.select_related("parent").defer(*self.deferred_geometry_fields, *parent_fields)
+
+
+class LocationsManager(TreeManager.from_queryset(LocationsQuerySet)):
     def get_queryset(self):
         return super().get_queryset().select_related("parent")
 
@@ -42,6 +76,13 @@ class LocationsManager(TreeManager):
     def archived_locations(self):
         return self.get_queryset().filter(is_active=False)
 
+    def containing(self, geometry):
+        """
+        Locations whose geometry contains `geometry` (e.g. reverse geocoding of a point).
+        The lookup runs against the subdivided geometry pieces, not the full polygons.
+        """
+        return self.get_queryset().filter(geometry_pieces__geom__contains=geometry).distinct()
+
 
 class AbstractLocation(TimeStampedModel, MPTTModel):
     """
@@ -85,24 +126,70 @@ class AbstractLocation(TimeStampedModel, MPTTModel):
         null=True,
         blank=True,
     )
+    # simplified variants of geom, maintained by unicef_locations.geometry.refresh_geometries
+    geom_coarse = models.MultiPolygonField(verbose_name=_("Coarse Geometry"), null=True, blank=True, editable=False)
+    geom_medium = models.MultiPolygonField(verbose_name=_("Medium Geometry"), null=True, blank=True, editable=False)
+    geom_fine = models.MultiPolygonField(verbose_name=_("Fine Geometry"), null=True, blank=True, editable=False)
     point = models.PointField(verbose_name=_("Point"), null=True, blank=True)
+    # point on surface of geom, maintained by unicef_locations.geometry.refresh_geometries
+    representative_point = models.PointField(
+        verbose_name=_("Representative Point"), null=True, blank=True, editable=False
+    )
+    # fingerprint of the imported geometry, see unicef_locations.preprocessing
+    geom_hash = models.CharField(verbose_name=_("Geometry Hash"), max_length=40, blank=True, default="", editable=False)
+    # envelope (of geom, or of point), area (m²) and validity of geom, maintained by unicef_locations.geometry
+    bbox_xmin = models.FloatField(verbose_name=_("Bounding Box X Min"), null=True, blank=True, editable=False)
+    bbox_ymin = models.FloatField(verbose_name=_("Bounding Box Y Min"), null=True, blank=True, editable=False)
+    bbox_xmax = models.FloatField(verbose_name=_("Bounding Box X Max"), null=True, blank=True, editable=False)
+    bbox_ymax = models.FloatField(verbose_name=_("Bounding Box Y Max"), null=True, blank=True, editable=False)
+    area = models.FloatField(verbose_name=_("Area"), null=True, blank=True, editable=False)
+    is_valid = models.BooleanField(verbose_name=_("Valid Geometry"), null=True, blank=True, editable=False)
     is_active = models.BooleanField(verbose_name=_("Active"), default=True, blank=True)
+    # denormalized names and ancestry paths, maintained by save() and unicef_locations.ancestry.refresh_ancestry
+    display_name = models.CharField(
+        verbose_name=_("Display Name"), max_length=512, blank=True, default="", editable=False
+    )
+    full_name = models.CharField(verbose_name=_("Full Name"), max_length=1024, blank=True, default="", editable=False)
+    ancestry_pcodes = models.TextField(verbose_name=_("Ancestry P Codes"), blank=True, default="", editable=False)
+    ancestry_names = models.TextField(verbose_name=_("Ancestry Names"), blank=True, default="", editable=False)
     created = AutoCreatedField(_("created"))
     modified = AutoLastModifiedField(_("modified"))
 
     objects = LocationsManager()
 
     def __str__(self):
-        return "{}{} ({}: {})".format(
-            self.name,
-            "" if self.is_active else " [Archived]",
-            self.admin_level_name,
-            self.p_code if self.p_code else "",
-        )
+        return format_display_name(self.name, self.is_active, self.admin_level_name, self.p_code)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        # whether the descendants need their ancestry rebuilt, see refresh_location_descendants_ancestry
+        self._ancestry_changed = False
+        if update_fields is None or set(update_fields).intersection(SOURCE_FIELDS):
+            stored = None if self._state.adding else (self.ancestry_pcodes, self.ancestry_names)
+            self.update_ancestry()
+            self._ancestry_changed = stored not in (None, (self.ancestry_pcodes, self.ancestry_names))
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, *DERIVED_FIELDS}
+        super().save(*args, **kwargs)
+
+    def update_ancestry(self):
+        """
+        Compute the denormalized names and ancestry paths from the (saved) parent
+        """
+        parent = self.parent
+        self.display_name = str(self)
+        self.full_name = format_full_name(self.display_name, parent.name if parent else None)
+        parent_pcodes = parent.ancestry_pcodes if parent else PCODE_SEPARATOR
+        self.ancestry_pcodes = f"{parent_pcodes}{self.p_code}{PCODE_SEPARATOR}"
+        self.ancestry_names = f"{parent.ancestry_names}{NAME_SEPARATOR}{self.name}" if parent else self.name
 
     @property
     def geo_point(self):
-        return self.point if self.point else self.geom.point_on_surface if self.geom else ""
+        if self.point:
+            return self.point
+        if self.representative_point or "geom" in self.get_deferred_fields():
+            return self.representative_point or ""
+        return self.geom.point_on_surface if self.geom else ""
 
     @property
     def point_lat_long(self):
@@ -112,15 +199,103 @@ class AbstractLocation(TimeStampedModel, MPTTModel):
         abstract = True
         unique_together = ("name", "p_code", "admin_level")
         ordering = ["name"]
+        indexes = [
+            # synchronizer and /locations/pcode/ lookups
+            models.Index(fields=["p_code", "is_active"], name="%(app_label)s_%(class)s_pcode_idx"),
+            # synchronizer clean_upper_level and the admin_level filter
+            models.Index(fields=["admin_level", "is_active"], name="%(app_label)s_%(class)s_level_idx"),
+            # bbox filter: a btree on the bounds could only range scan its first column
+            GistIndex(bbox_envelope(), name="%(app_label)s_%(class)s_bbox_idx"),
+            # prefix matches on the ancestry path
+            models.Index(
+                fields=["ancestry_pcodes"],
+                name="%(app_label)s_%(class)s_ancestry_idx",
+                opclasses=["text_pattern_ops"],
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["p_code"],
+                condition=models.Q(is_active=True) & ~models.Q(p_code=""),
+                name="%(app_label)s_%(class)s_active_pcode",
+            ),
+        ]
 
 
 @receiver(post_delete, sender=settings.UNICEF_LOCATIONS_MODEL)
 @receiver(post_save, sender=settings.UNICEF_LOCATIONS_MODEL)
 def invalidate_locations_etag(sender, instance, **kwargs):
     """
-    Invalidate the locations etag in the cache on every change.
+    Invalidate the locations etag in the cache on every change, once committed: the snapshots and
+    the etags of the new version must not be computed from the data before the change.
+    """
+    invalidate_cache_on_commit()
+
+
+@receiver(post_save, sender=settings.UNICEF_LOCATIONS_MODEL)
+def refresh_location_geometries(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Refresh the data derived from the geometry, unless a bulk operation takes care of it.
+    """
+    if raw or geometry_refresh_deferred():
+        return
+    if update_fields is not None and "geom" not in update_fields:
+        return
+    refresh_geometries(sender.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=settings.UNICEF_LOCATIONS_MODEL)
+def refresh_location_descendants_ancestry(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Propagate a change of name, p_code or parent to the ancestry paths of the descendants.
+    """
+    if raw or geometry_refresh_deferred():
+        return
+    if not getattr(instance, "_ancestry_changed", False):
+        return
+    # the tree fields of the saved instance may be stale
+    node = sender.objects.lean().only("tree_id", "lft", "rght", "level").get(pk=instance.pk)
+    if not node.is_leaf_node():
+        refresh_ancestry(node.get_descendants())
+
+
+class LocationGeometryPiece(models.Model):
+    """
+    Piece of a location geometry with a bounded number of vertices (see ST_Subdivide),
+    spatial lookups are much cheaper against the pieces than against the full polygons.
     """
-    invalidate_cache()
+
+    location = models.ForeignKey(
+        settings.UNICEF_LOCATIONS_MODEL,
+        verbose_name=_("Location"),
+        related_name="geometry_pieces",
+        on_delete=models.CASCADE,
+    )
+    geom = models.PolygonField(verbose_name=_("Geometry"))
+
+    class Meta:
+        verbose_name = "Location Geometry Piece"
+
+
+PARENT_ASSIGNMENT_CODE, PARENT_ASSIGNMENT_SPATIAL = "code", "spatial"
+PARENT_ASSIGNMENT_CHOICES = (
+    (PARENT_ASSIGNMENT_CODE, _("Parent code column")),
+    (PARENT_ASSIGNMENT_SPATIAL, _("Spatial (representative point within the parent level geometries)")),
+)
+
+FETCH_BACKEND_PAGINATED, FETCH_BACKEND_CSV, FETCH_BACKEND_GEOJSON = "paginated", "csv", "geojson"
+FETCH_BACKEND_CHOICES = (
+    (FETCH_BACKEND_PAGINATED, _("Paginated SQL API requests")),
+    (FETCH_BACKEND_CSV, _("Streamed CSV export")),
+    (FETCH_BACKEND_GEOJSON, _("Streamed GeoJSON export")),
+)
+
+GEOMETRY_ENCODING_GEOJSON, GEOMETRY_ENCODING_WKB, GEOMETRY_ENCODING_TWKB = "geojson", "wkb", "twkb"
+GEOMETRY_ENCODING_CHOICES = (
+    (GEOMETRY_ENCODING_GEOJSON, _("GeoJSON")),
+    (GEOMETRY_ENCODING_WKB, _("Hex WKB")),
+    (GEOMETRY_ENCODING_TWKB, _("TWKB")),
+)
 
 
 class CartoDBTable(TimeStampedModel, MPTTModel):
@@ -148,7 +323,44 @@ class CartoDBTable(TimeStampedModel, MPTTModel):
         verbose_name=_("Parent"),
         on_delete=models.CASCADE,
     )
+    parent_assignment = models.CharField(
+        max_length=16,
+        choices=PARENT_ASSIGNMENT_CHOICES,
+        default=PARENT_ASSIGNMENT_CODE,
+        verbose_name=_("Parent Assignment"),
+    )
     color = models.CharField(blank=True, default=get_random_color, max_length=7, verbose_name=_("Color"))
+    simplify_tolerance = models.FloatField(
+        null=True,
+        blank=True,
+        verbose_name=_("Simplify Tolerance"),
+        help_text=_("Simplify the imported geometries (topology preserving), in degrees"),
+    )
+    repair_geometries = models.BooleanField(
+        default=False,
+        verbose_name=_("Repair Geometries"),
+        help_text=_("Make the invalid imported geometries valid (ST_MakeValid)"),
+    )
+    fetch_backend = models.CharField(
+        max_length=16,
+        choices=FETCH_BACKEND_CHOICES,
+        default=FETCH_BACKEND_PAGINATED,
+        verbose_name=_("Fetch Backend"),
+        help_text=_("How the rows are fetched from Carto, the streamed exports fall back to paginated requests"),
+    )
+    geometry_encoding = models.CharField(
+        max_length=16,
+        choices=GEOMETRY_ENCODING_CHOICES,
+        default=GEOMETRY_ENCODING_GEOJSON,
+        verbose_name=_("Geometry Encoding"),
+        help_text=_("Encoding of the geometries transferred from Carto (not used by the GeoJSON export)"),
+    )
+    geometry_precision = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        verbose_name=_("Geometry Precision"),
+        help_text=_("Decimal digits of the transferred coordinates (GeoJSON and TWKB), full precision if empty"),
+    )
 
     def __str__(self):
         return self.table_name
@@ -0,0 +1,94 @@
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class LocationCursorPagination(BasePagination):
+    """
+    Opt-in keyset pagination, enabled by the ``page_size`` query parameter.
+
+    Rows are ordered by ``id`` (default) or by their position in the tree (``?ordering=tree``)
+    and every page is fetched with a keyset condition on the last row of the previous one,
+    so that deep pages cost the same as the first one.
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    ordering_query_param = "ordering"
+    max_page_size = 10000
+    orderings = {
+        "id": ("id",),
+        "tree": ("tree_id", "lft"),
+    }
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.request = request
+        self.ordering = self.get_ordering(request)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_condition(position))
+
+        rows = list(queryset[: self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[: self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return None
+        return min(page_size, self.max_page_size) if page_size > 0 else None
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get(self.ordering_query_param, "id")
+        if ordering not in self.orderings:
+            raise ValidationError({self.ordering_query_param: "Must be one of {}".format(", ".join(self.orderings))})
+        return self.orderings[ordering]
+
+    def get_keyset_condition(self, position):
+        """
+        Rows strictly after `position` in the lexicographic order of the ordering fields
+        """
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            equal = {name: value for name, value in zip(self.ordering[:i], position)}
+            condition |= Q(**equal, **{f"{field}__gt": position[i]})
+        return condition
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+        except (TypeError, ValueError):
+            raise NotFound("Invalid cursor")
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound("Invalid cursor")
+        if not all(isinstance(value, int) and not isinstance(value, bool) for value in position):
+            raise NotFound("Invalid cursor")
+        return position
+
+    def encode_cursor(self, position):
+        return base64.urlsafe_b64encode(json.dumps(position).encode("ascii")).decode("ascii")
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position = [getattr(self.page[-1], field) for field in self.ordering]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position))
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
@@ -0,0 +1,221 @@
+"""
+Geometry preprocessing stage of the synchronizer, between the fetch of the Carto rows and the writes.
+
+The geometries of the rows (GeoJSON, hex WKB or base64 TWKB, see ``CartoDBTable.geometry_encoding``)
+are parsed, validated (and optionally repaired and simplified)
+and fingerprinted in batches: with vectorized shapely 2 operations when the optional ``numpy`` and
+``shapely>=2`` packages are installed (``pip install unicef-locations[index]``), with GEOS otherwise.
+Batches are spread over a pool of worker processes, so that large imports use all the cores.
+
+The prepared geometries are handed to the ORM as WKB, which is much cheaper to load than GeoJSON.
+"""
+
+import base64
+import binascii
+import hashlib
+import logging
+import multiprocessing
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+
+from . import twkb
+from .config import conf
+
+try:
+    import numpy as np
+    import shapely
+except ImportError:  # pragma: no cover
+    np = shapely = None
+
+logger = logging.getLogger(__name__)
+
+POINT, POLYGON, MULTIPOLYGON = "Point", "Polygon", "MultiPolygon"
+GEOJSON, WKB, TWKB = "geojson", "wkb", "twkb"
+ENCODING_LABELS = {GEOJSON: "GeoJSON", WKB: "WKB", TWKB: "TWKB"}
+
+# wkb: 2D WKB of the geometry (polygons are promoted to multipolygons), None when it cannot be used
+# fingerprint: sha1 of the WKB of the normalized geometry, equal for equivalent geometries
+# point: WKB of a point on its surface, used by the spatial parent assignment
+PreparedGeometry = namedtuple("PreparedGeometry", "wkb geom_type is_valid repaired fingerprint point error")
+
+
+def get_fingerprint(wkb):
+    return hashlib.sha1(wkb).hexdigest()
+
+
+def decode_twkb(value):
+    """
+    WKB of the base64 encoded TWKB `value`, None if it cannot be decoded
+    """
+    if not value:
+        return None
+    try:
+        # base64 lines are wrapped by the postgres encode(), the newlines are discarded
+        return twkb.to_wkb(base64.b64decode(value))
+    except (binascii.Error, ValueError):
+        return None
+
+
+def _polygonal_part(geometry):
+    parts = shapely.get_parts(geometry)
+    parts = shapely.get_parts(parts[np.isin(shapely.get_type_id(parts), (3, 6))])
+    return shapely.multipolygons(parts) if len(parts) else None
+
+
+def load_batch_shapely(values, encoding):
+    if encoding == GEOJSON:
+        return shapely.from_geojson(np.asarray(values, dtype=object), on_invalid="ignore")
+    if encoding == TWKB:
+        values = [decode_twkb(value) for value in values]
+    return shapely.from_wkb(np.asarray(values, dtype=object), on_invalid="ignore")
+
+
+def prepare_batch_shapely(values, repair=False, tolerance=None, encoding=GEOJSON):
+    geometries = load_batch_shapely(values, encoding)
+    type_ids = shapely.get_type_id(geometries)
+    polygonal = np.isin(type_ids, (3, 6))
+
+    repaired = np.zeros(len(geometries), dtype=bool)
+    if repair:
+        repaired = polygonal & ~shapely.is_valid(geometries)
+        geometries[repaired] = [_polygonal_part(geometry) for geometry in shapely.make_valid(geometries[repaired])]
+        polygonal &= ~shapely.is_missing(geometries)
+    if tolerance:
+        geometries[polygonal] = shapely.simplify(geometries[polygonal], tolerance, preserve_topology=True)
+
+    single = polygonal & (shapely.get_type_id(geometries) == 3)
+    geometries[single] = shapely.multipolygons(geometries[single], indices=np.arange(single.sum()))
+
+    usable = polygonal | (type_ids == 0)
+    valid = shapely.is_valid(geometries)
+    wkbs = shapely.to_wkb(geometries, output_dimension=2)
+    normalized_wkbs = shapely.to_wkb(shapely.normalize(geometries), output_dimension=2)
+    points = shapely.to_wkb(shapely.point_on_surface(geometries), output_dimension=2)
+
+    prepared = []
+    for i, geometry in enumerate(geometries):
+        if not usable[i]:
+            if repaired[i]:
+                error = "Geometry cannot be repaired"
+            elif geometry is None:
+                error = f"Invalid {ENCODING_LABELS[encoding]}"
+            else:
+                error = f"Unsupported geometry type {geometry.geom_type}"
+            prepared.append(PreparedGeometry(None, None, False, bool(repaired[i]), "", None, error))
+            continue
+        geom_type = POINT if type_ids[i] == 0 else MULTIPOLYGON
+        fingerprint = get_fingerprint(normalized_wkbs[i])
+        prepared.append(
+            PreparedGeometry(wkbs[i], geom_type, bool(valid[i]), bool(repaired[i]), fingerprint, points[i], "")
+        )
+    return prepared
+
+
+def prepare_batch_geos(values, repair=False, tolerance=None, encoding=GEOJSON):
+    from django.contrib.gis.geos import GeometryCollection, GEOSException, GEOSGeometry, MultiPolygon
+
+    prepared = []
+    for value in values:
+        if encoding == TWKB:
+            value = decode_twkb(value)
+            value = memoryview(value) if value else None
+        try:
+            geometry = GEOSGeometry(value)
+        except (GEOSException, TypeError, ValueError):
+            error = f"Invalid {ENCODING_LABELS[encoding]}"
+            prepared.append(PreparedGeometry(None, None, False, False, "", None, error))
+            continue
+        if geometry.geom_type not in (POINT, POLYGON, MULTIPOLYGON):
+            error = f"Unsupported geometry type {geometry.geom_type}"
+            prepared.append(PreparedGeometry(None, None, False, False, "", None, error))
+            continue
+
+        repaired = False
+        if geometry.geom_type != POINT:
+            if repair and not geometry.valid:
+                repaired = True
+                made_valid = geometry.make_valid()
+                # a single geometry (e.g. the line of a collapsed ring) is not iterated over its coordinates
+                made_valid = made_valid if isinstance(made_valid, GeometryCollection) else [made_valid]
+                parts = [part for part in made_valid if part.geom_type in (POLYGON, MULTIPOLYGON)]
+                polygons = [
+                    polygon for part in parts for polygon in (part if part.geom_type == MULTIPOLYGON else [part])
+                ]
+                if not polygons:
+                    prepared.append(PreparedGeometry(None, None, False, True, "", None, "Geometry cannot be repaired"))
+                    continue
+                geometry = MultiPolygon(polygons)
+            if tolerance:
+                geometry = geometry.simplify(tolerance, preserve_topology=True)
+            if geometry.geom_type == POLYGON:
+                geometry = MultiPolygon(geometry)
+
+        wkb = bytes(geometry.wkb)
+        fingerprint = get_fingerprint(bytes(geometry.normalize(clone=True).wkb))
+        point = bytes(geometry.point_on_surface.wkb)
+        prepared.append(PreparedGeometry(wkb, geometry.geom_type, geometry.valid, repaired, fingerprint, point, ""))
+    return prepared
+
+
+def prepare_batch(values, repair=False, tolerance=None, encoding=GEOJSON):
+    if shapely is not None:
+        return prepare_batch_shapely(values, repair, tolerance, encoding)
+    return prepare_batch_geos(values, repair, tolerance, encoding)  # pragma: no cover
+
+
+def get_workers(batches):
+    workers = min(conf.PREPROCESS_WORKERS or os.cpu_count() or 1, batches)
+    if workers > 1 and multiprocessing.current_process().daemon:
+        # e.g. celery prefork workers, which cannot start child processes
+        logger.info("Geometry preprocessing runs in a daemon process, no worker processes")
+        return 1
+    return workers
+
+
+def preprocess_geometries(values, repair=False, tolerance=None, encoding=GEOJSON):
+    """
+    Parse (`encoding`), validate, repair (`repair`), simplify (`tolerance`, topology preserving) and
+    fingerprint the geometries, returning a PreparedGeometry for each of them, in order.
+    """
+    size = conf.PREPROCESS_BATCH_SIZE
+    rows = iter(values)
+    batches = list(iter(lambda: list(islice(rows, size)), []))
+    if not batches:
+        return []
+    workers = get_workers(len(batches))
+
+    if workers > 1:
+        # spawned processes do not share the database connection of the caller
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            results = list(pool.map(prepare_batch, batches, repeat(repair), repeat(tolerance), repeat(encoding)))
+    else:
+        results = [prepare_batch(batch, repair, tolerance, encoding) for batch in batches]
+
+    prepared = [geometry for batch in results for geometry in batch]
+    logger.info(f"Preprocessed {len(prepared)} geometries in {len(batches)} batches with {workers} processes")
+    return prepared
+
+
+def dump_prepared(geometries):
+    """
+    JSON serializable form of the prepared `geometries` (e.g. celery results), the WKB are hex encoded
+    """
+    return [
+        list(geometry._replace(wkb=geometry.wkb and geometry.wkb.hex(), point=geometry.point and geometry.point.hex()))
+        for geometry in geometries
+    ]
+
+
+def load_prepared(values):
+    """
+    Prepared geometries dumped by `dump_prepared`
+    """
+    return [
+        geometry._replace(
+            wkb=geometry.wkb and bytes.fromhex(geometry.wkb), point=geometry.point and bytes.fromhex(geometry.point)
+        )
+        for geometry in map(PreparedGeometry._make, values)
+    ]
@@ -0,0 +1,62 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+def to_columns(rows, dictionary_fields=()):
+    """
+    Converts a list of records in one array per field. The values of `dictionary_fields`
+    are replaced by their index in the matching entry of "dictionaries".
+    """
+    fields = list(rows[0].keys()) if rows else []
+    columns = {field: [row[field] for row in rows] for field in fields}
+    dictionaries = {}
+    for field in dictionary_fields:
+        if field in columns:
+            values = {}
+            columns[field] = [values.setdefault(value, len(values)) for value in columns[field]]
+            dictionaries[field] = list(values)
+    return {"count": len(rows), "fields": fields, "columns": columns, "dictionaries": dictionaries}
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """
+    Renders lists as JSON with one array per field, without repeating the keys on every record
+    """
+
+    media_type = "application/vnd.unicef.columnar+json"
+    format = "columnar"
+    dictionary_fields = ("admin_level_name",)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, list):
+            data = to_columns(data, self.dictionary_fields)
+        elif isinstance(data, dict) and isinstance(data.get("results"), list):
+            data = {**data, "results": to_columns(data["results"], self.dictionary_fields)}
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=str)
+
+
+def get_list_renderer_classes():
+    """
+    JSON renderers plus the compact formats available in the environment
+    """
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, ColumnarJSONRenderer]
+    if msgpack is not None:
+        renderer_classes.append(MessagePackRenderer)
+    return renderer_classes
@@ -0,0 +1,177 @@
+"""
+Retry policy of the Carto requests: exponential backoff with full jitter for the transient errors
+(connection errors, timeouts, rate limiting and server errors), immediate failure for the others,
+and a circuit breaker per Carto domain which stops sending requests to a failing domain for a while.
+
+The policy class can be replaced with the ``UNICEF_LOCATIONS_CARTO_RETRY_POLICY`` setting; the
+attempts, retries, failures and latency of the requests are counted per domain (see `get_stats`).
+"""
+
+import logging
+import random
+import threading
+import time
+
+import requests
+from carto.exceptions import CartoRateLimitException
+
+from .config import conf
+from .exceptions import CircuitOpen
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+RETRYABLE_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+_lock = threading.Lock()
+_breakers = {}
+_stats = {}
+
+
+def iter_causes(error):
+    """
+    The error and the errors it wraps (carto wraps the exceptions in CartoException(error))
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        wrapped = error.args[0] if error.args and isinstance(error.args[0], BaseException) else None
+        error = wrapped or error.__cause__ or error.__context__
+
+
+class CircuitBreaker:
+    """
+    Opened after `failure_threshold` consecutive transient failures, it rejects the requests
+    until `reset_timeout` seconds have passed, then lets one trial request through (half open).
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == self.HALF_OPEN and not self.trial:
+                self.trial = True
+                return True
+            return state == self.CLOSED
+
+    def record_success(self):
+        with self.lock:
+            self.failures, self.opened_at, self.trial = 0, None, False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.failure_threshold:
+                self.opened_at, self.trial = time.monotonic(), False
+
+
+def get_circuit_breaker(domain):
+    with _lock:
+        if domain not in _breakers:
+            _breakers[domain] = CircuitBreaker(conf.CARTO_CIRCUIT_FAILURE_THRESHOLD, conf.CARTO_CIRCUIT_RESET_TIMEOUT)
+        return _breakers[domain]
+
+
+def record(domain, **counts):
+    with _lock:
+        stats = _stats.setdefault(
+            domain, {"calls": 0, "attempts": 0, "retries": 0, "failures": 0, "rejected": 0, "latency": 0.0}
+        )
+        for name, value in counts.items():
+            stats[name] += value
+
+
+def get_stats(domain=None):
+    """
+    Request counters (and total latency in seconds) of the Carto `domain`, of all the domains by default
+    """
+    with _lock:
+        if domain is not None:
+            return dict(_stats.get(domain, {}))
+        return {name: dict(stats) for name, stats in _stats.items()}
+
+
+def reset():
+    with _lock:
+        _breakers.clear()
+        _stats.clear()
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=None, base_delay=None, max_delay=None, sleep=time.sleep):
+        self.max_attempts = max(1, conf.CARTO_RETRY_MAX_ATTEMPTS if max_attempts is None else max_attempts)
+        self.base_delay = conf.CARTO_RETRY_BASE_DELAY if base_delay is None else base_delay
+        self.max_delay = conf.CARTO_RETRY_MAX_DELAY if max_delay is None else max_delay
+        self.sleep = sleep
+
+    def is_retryable(self, error):
+        for cause in iter_causes(error):
+            if isinstance(cause, (CartoRateLimitException, *RETRYABLE_ERRORS)):
+                return True
+            status_code = getattr(cause, "status_code", None)
+            if status_code is not None:
+                return status_code in RETRYABLE_STATUS_CODES
+        return False
+
+    def get_delay(self, attempt, error=None):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        for cause in iter_causes(error):
+            if isinstance(cause, CartoRateLimitException):
+                delay = max(delay, min(self.max_delay, cause.retry_after))
+        return delay
+
+    def call(self, domain, func, *args, **kwargs):
+        """
+        Call `func` (a request to the Carto `domain`), retrying the transient errors
+        """
+        breaker = get_circuit_breaker(domain)
+        record(domain, calls=1)
+        for attempt in range(1, self.max_attempts + 1):
+            if not breaker.allow():
+                record(domain, rejected=1)
+                raise CircuitOpen(f"Too many errors from {domain}.carto.com, requests suspended")
+            start = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                retryable = self.is_retryable(e)
+                record(domain, attempts=1, latency=time.monotonic() - start)
+                if not retryable:
+                    # the domain answered, the request itself is wrong
+                    breaker.record_success()
+                    record(domain, failures=1)
+                    raise
+                breaker.record_failure()
+                if attempt == self.max_attempts:
+                    record(domain, failures=1)
+                    raise
+                delay = self.get_delay(attempt, e)
+                logger.warning(f"Carto request to {domain} failed ({e}), retry {attempt} in {delay:.2f}s")
+                record(domain, retries=1)
+                self.sleep(delay)
+            else:
+                record(domain, attempts=1, latency=time.monotonic() - start)
+                breaker.record_success()
+                return result
+
+
+def get_retry_policy(**kwargs):
+    return conf.CARTO_RETRY_POLICY(**kwargs)
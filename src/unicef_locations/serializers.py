@@ -1,5 +1,6 @@
 from rest_framework import serializers
 
+from .config import conf
 from .models import CartoDBTable
 from .utils import get_location_model
 
@@ -12,21 +13,38 @@ class CartoDBTableSerializer(serializers.ModelSerializer):
         fields = ("id", "domain", "api_key", "table_name", "display_name", "pcode_col", "color", "name_col")
 
 
-class LocationLightSerializer(serializers.ModelSerializer):
+class SparseFieldsetSerializerMixin:
+    """
+    Drops the fields not listed in the ``fields`` entry of the serializer context (see views.SparseFieldsetMixin)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = self.context.get("fields")
+        if requested is not None:
+            for name in set(self.fields).difference(requested):
+                self.fields.pop(name)
+
+
+class LocationLightSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     id = serializers.CharField(read_only=True)
-    name_display = serializers.CharField(source="__str__")
-    name = serializers.SerializerMethodField()
+    # stored by AbstractLocation.save and unicef_locations.ancestry.refresh_ancestry
+    name_display = serializers.CharField(source="display_name", read_only=True)
+    name = serializers.CharField(source="full_name", read_only=True)
 
     class Meta:
         model = get_location_model()
         fields = ("id", "name", "p_code", "admin_level", "admin_level_name", "parent", "name_display")
-
-    @staticmethod
-    def get_name(obj):
-        return "{}{}".format(
-            str(obj),
-            " -- {}".format(obj.parent.name) if obj.parent else "",
-        )
+        # model columns needed to render each field, used to restrict the columns fetched from the database
+        field_columns = {
+            "id": ("id",),
+            "name": ("full_name",),
+            "p_code": ("p_code",),
+            "admin_level": ("admin_level",),
+            "admin_level_name": ("admin_level_name",),
+            "parent": ("parent",),
+            "name_display": ("display_name",),
+        }
 
 
 class LocationSerializer(LocationLightSerializer):
@@ -35,6 +53,60 @@ class LocationSerializer(LocationLightSerializer):
     class Meta(LocationLightSerializer.Meta):
         model = get_location_model()
         fields = LocationLightSerializer.Meta.fields + ("geo_point",)
+        field_columns = {**LocationLightSerializer.Meta.field_columns, "geo_point": ("point", "representative_point")}
+
+
+class LocationTreeNodeSerializer(LocationLightSerializer):
+    """
+    Location with the size of its subtree, annotated by `LocationsViewSet.get_tree_level_queryset`
+    """
+
+    has_children = serializers.BooleanField(read_only=True)
+    descendant_count = serializers.IntegerField(read_only=True)
+
+    class Meta(LocationLightSerializer.Meta):
+        fields = LocationLightSerializer.Meta.fields + ("has_children", "descendant_count")
+
+
+class LocationLookupSerializer(serializers.ModelSerializer):
+    """
+    Lean representation used when resolving large batches of locations
+    """
+
+    class Meta:
+        model = get_location_model()
+        fields = ("id", "name", "p_code", "admin_level", "admin_level_name", "parent", "is_active")
+
+
+class LocationBulkLookupSerializer(serializers.Serializer):
+    p_codes = serializers.ListField(child=serializers.CharField(max_length=32), required=False, default=list)
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+
+    def validate(self, attrs):
+        if not attrs["p_codes"] and not attrs["ids"]:
+            raise serializers.ValidationError("At least one p_code or id is required")
+        if len(attrs["p_codes"]) + len(attrs["ids"]) > conf.BULK_LOOKUP_MAX_KEYS:
+            raise serializers.ValidationError(f"No more than {conf.BULK_LOOKUP_MAX_KEYS} keys can be resolved at once")
+        return attrs
+
+
+# columns of the exports, the stored derived columns (names, ancestry, bounding box...) are not exported
+EXPORT_COLUMNS = (
+    "name",
+    "admin_level",
+    "admin_level_name",
+    "latitude",
+    "longitude",
+    "p_code",
+    "is_active",
+    "created",
+    "modified",
+    "lft",
+    "rght",
+    "tree_id",
+    "level",
+    "parent",
+)
 
 
 class LocationExportSerializer(serializers.ModelSerializer):
@@ -44,7 +116,7 @@ class LocationExportSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = get_location_model()
-        fields = "__all__"
+        fields = ("id", "name_display", "geo_point", "point", "geom", *EXPORT_COLUMNS)
 
 
 class LocationExportFlatSerializer(serializers.ModelSerializer):
@@ -54,7 +126,21 @@ class LocationExportFlatSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = get_location_model()
-        fields = "__all__"
+        fields = ("id", "name_display", "geom", "point", *EXPORT_COLUMNS)
 
     def get_geom(self, obj):
+        if obj.representative_point or "geom" in obj.get_deferred_fields():
+            return obj.representative_point or ""
         return obj.geom.point_on_surface if obj.geom else ""
+
+
+class LocationExportPropertiesSerializer(serializers.ModelSerializer):
+    """
+    Attributes of the exported GeoJSON features, the geometry is exported as the feature geometry
+    """
+
+    name_display = serializers.CharField(source="__str__")
+
+    class Meta:
+        model = get_location_model()
+        fields = ("id", "name_display", *EXPORT_COLUMNS)
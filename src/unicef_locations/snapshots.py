@@ -0,0 +1,136 @@
+"""
+Gzipped static snapshots of the location lists, served by the web server instead of Django.
+
+Snapshots are built (see tasks.build_locations_snapshots) for the current cache version the first
+time a list is requested after a change; from then on the list views redirect to the snapshot,
+either with a plain redirect to the storage URL or with an nginx ``X-Accel-Redirect``.
+
+The snapshots are stored as ``<variant>.json.gz``, the server sending them must add the
+``Content-Encoding: gzip`` header:
+
+* redirect: the storages deriving the metadata from the file name (e.g. the django-storages S3
+  storage, django.views.static.serve) serve them as ``application/json`` gzip encoded; a web server
+  serving MEDIA_ROOT needs e.g. ``location ~ [.]json[.]gz$ { gzip off; types { application/json gz; }
+  add_header Content-Encoding gzip; }``
+* x-accel: nginx does not pass the Content-Encoding of the upstream response, the redirect points to
+  the uncompressed name (``<variant>.json``) so that ``gzip_static`` serves the gzipped file with the
+  right headers: ``location /protected/ { internal; alias <MEDIA_ROOT>/; gzip_static always; gunzip on; }``
+  (``gunzip`` decompresses it for the clients not accepting gzip)
+"""
+
+import gzip
+import json
+import logging
+import tempfile
+
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseRedirect
+from django.utils.module_loading import import_string
+from rest_framework.renderers import JSONRenderer
+
+from .cache import get_cache_version
+from .config import conf
+from .exports import get_export_queryset, iter_chunks, iter_features
+from .serializers import LocationLightSerializer, LocationSerializer
+from .utils import get_location_model
+
+logger = logging.getLogger(__name__)
+
+REDIRECT, X_ACCEL_REDIRECT = "redirect", "x-accel"
+
+# variant name: (serializer, queryset), matching the unfiltered list endpoints
+VARIANTS = {
+    "locations": (LocationSerializer, lambda: get_location_model().objects.lean()),
+    "locations-light": (LocationLightSerializer, lambda: get_location_model().objects.lean()),
+}
+
+
+def get_storage():
+    return import_string(conf.SNAPSHOT_STORAGE)() if conf.SNAPSHOT_STORAGE else default_storage
+
+
+def get_snapshot_name(version, variant, extension="json"):
+    return f"{conf.SNAPSHOT_PATH}/{version}/{variant}.{extension}.gz"
+
+
+def get_snapshot_cache_key(version, variant):
+    return f"locations-snapshot-{version}-{variant}"
+
+
+def write_json(output, variant):
+    serializer_class, get_queryset = VARIANTS[variant]
+    renderer = JSONRenderer()
+    output.write(b"[")
+    separator = b""
+    for __, data in iter_chunks(get_queryset(), serializer_class):
+        output.write(separator + renderer.render(data)[1:-1])
+        separator = b","
+    output.write(b"]")
+
+
+def write_geojson(output):
+    output.write(b'{"type": "FeatureCollection", "features": [')
+    separator = b""
+    for feature in iter_features(get_export_queryset()):
+        output.write(separator + json.dumps(feature, default=str).encode())
+        separator = b","
+    output.write(b"]}")
+
+
+def save_snapshot(storage, name, writer, *args):
+    with tempfile.TemporaryFile() as tmp:
+        with gzip.GzipFile(fileobj=tmp, mode="wb") as output:
+            writer(output, *args)
+        tmp.seek(0)
+        if storage.exists(name):
+            storage.delete(name)
+        return storage.save(name, File(tmp))
+
+
+def build_snapshots():
+    """
+    Writes the snapshots of every list variant for the current cache version, and removes the older ones
+    """
+    version = get_cache_version()
+    storage = get_storage()
+    for variant in VARIANTS:
+        name = save_snapshot(storage, get_snapshot_name(version, variant), write_json, variant)
+        cache.set(get_snapshot_cache_key(version, variant), name, timeout=None)
+        logger.info(f"Built snapshot {name}")
+    if conf.SNAPSHOT_GEOJSON:
+        name = save_snapshot(storage, get_snapshot_name(version, "locations", "geojson"), write_geojson)
+        logger.info(f"Built snapshot {name}")
+    prune_snapshots(storage, version)
+
+
+def prune_snapshots(storage, version):
+    directories, __ = storage.listdir(conf.SNAPSHOT_PATH)
+    for directory in directories:
+        if directory != str(version):
+            for filename in storage.listdir(f"{conf.SNAPSHOT_PATH}/{directory}")[1]:
+                storage.delete(f"{conf.SNAPSHOT_PATH}/{directory}/{filename}")
+
+
+def get_snapshot_response(variant):
+    """
+    Response pointing to the snapshot of `variant` for the current cache version.
+    When it doesn't exist yet, its build is scheduled (once per version) and None is returned.
+    """
+    from .tasks import build_locations_snapshots
+
+    version = get_cache_version()
+    name = cache.get(get_snapshot_cache_key(version, variant))
+    if name is None:
+        if cache.add(f"locations-snapshot-scheduled-{version}", True):
+            transaction.on_commit(build_locations_snapshots.delay)
+        return None
+
+    if conf.SNAPSHOT_MODE == X_ACCEL_REDIRECT:
+        # served by nginx gzip_static, from <name>.gz
+        response = HttpResponse(content_type="application/json")
+        response["X-Accel-Redirect"] = f"{conf.SNAPSHOT_ACCEL_PREFIX}{name.removesuffix('.gz')}"
+        return response
+    return HttpResponseRedirect(get_storage().url(name))
@@ -1,55 +1,107 @@
+import csv
 import logging
 import time
 from datetime import datetime
 
+import requests
 from carto.exceptions import CartoException
 from carto.sql import SQLClient
 from django.contrib.admin.utils import NestedObjects
+from django.contrib.gis.geos import GEOSGeometry
 from django.db import transaction
 from django.db.utils import IntegrityError
 
-from unicef_locations.auth import LocationsCartoNoAuthClient
+from unicef_locations.ancestry import refresh_ancestry
+from unicef_locations.auth import get_carto_client
+from unicef_locations.cache import invalidate_cache_on_commit
+from unicef_locations.carto_cache import CartoPageCache
+from unicef_locations.carto_export import fetch_export, GEOJSON
+from unicef_locations.config import conf
 from unicef_locations.exceptions import InvalidRemap
-from unicef_locations.models import CartoDBTable
+from unicef_locations.geometry import defer_geometry_refresh, locate_points, refresh_geometries, repair_geometries
+from unicef_locations.models import (
+    CartoDBTable,
+    FETCH_BACKEND_PAGINATED,
+    GEOMETRY_ENCODING_GEOJSON,
+    GEOMETRY_ENCODING_TWKB,
+    GEOMETRY_ENCODING_WKB,
+    LocationGeometryPiece,
+    PARENT_ASSIGNMENT_SPATIAL,
+)
+from unicef_locations.preprocessing import POINT, preprocess_geometries
+from unicef_locations.retry import get_retry_policy, get_stats
 from unicef_locations.utils import get_location_model, get_remapping
 
 logger = logging.getLogger(__name__)
 
+# decimal digits of the TWKB coordinates when the table has no geometry precision (~10cm)
+DEFAULT_TWKB_PRECISION = 6
+
+
+def is_referenced(location):
+    """
+    Check if any object (other than its own geometry pieces) refers to the location
+    """
+    collector = NestedObjects(using="default")
+    collector.collect([location])
+    return any(not isinstance(obj, LocationGeometryPiece) for obj in collector.edges.get(location, []))
+
 
 class LocationSynchronizer:
     """Component to update locations"""
 
     def __init__(self, pk) -> None:
         self.carto = CartoDBTable.objects.get(pk=pk)
-        self.sql_client = SQLClient(LocationsCartoNoAuthClient(base_url=f"https://{self.carto.domain}.carto.com/"))
+        # matched / ambiguous / unmatched rows of the last spatial parent assignment
+        self.parent_report = None
+        # on-disk cache of the fetched pages, see get_cartodb_locations
+        self.page_cache = None
+        # encoding of the geometries of the fetched rows, the GeoJSON export always returns GeoJSON
+        self.geometry_encoding = self.carto.geometry_encoding
+        self.sql_client = SQLClient(get_carto_client(self.carto.domain))
+        self.retry_policy = get_retry_policy()
 
-    def create_or_update_locations(self):
+    def create_or_update_locations(self, rows=None, geometries=None):
         """
         Create or update locations based on p-code (only active locations are considerate)
-
+        The rows are fetched and preprocessed unless given (with their `geometries`, by the distributed import)
         """
         logging.info("Create/Update new locations")
-        rows = self.get_cartodb_locations()
+        if rows is None:
+            rows = self.get_cartodb_locations()
+            geometries = self.preprocess_geometries(rows)
+        spatial_parents = None
+        if self.carto.parent_assignment == PARENT_ASSIGNMENT_SPATIAL:
+            spatial_parents = self.assign_parents_spatially(rows, geometries)
         new, updated, skipped, error = 0, 0, 0, 0
 
-        for row in rows:
+        for i, (row, geometry) in enumerate(zip(rows, geometries)):
             pcode = row[self.carto.pcode_col]
             name = row[self.carto.name_col]
-            geom = row["the_geom"]
 
-            if all([name, pcode, geom]):
-                geom_key = "point" if "Point" in row["the_geom"] else "geom"
+            if geometry.error and row["the_geom"]:
+                logger.warning(f"Invalid geometry for pcode {pcode}: {geometry.error}")
+
+            if all([name, pcode, geometry.wkb]):
+                geom_key = "point" if geometry.geom_type == POINT else "geom"
                 default_dict = {
                     "admin_level": self.carto.admin_level,
                     "admin_level_name": self.carto.admin_level_name,
                     "name": name,
-                    geom_key: geom,
+                    geom_key: GEOSGeometry(memoryview(geometry.wkb), srid=4326),
+                    "geom_hash": geometry.fingerprint,
                 }
 
                 parent_pcode = row[self.carto.parent_code_col] if self.carto.parent_code_col in row else None
-                if parent_pcode:
+                if spatial_parents is not None:
+                    if i not in spatial_parents:
+                        skipped += 1
+                        logger.info(f"Skipping row pcode {pcode}")
+                        continue
+                    default_dict["parent"] = spatial_parents[i]
+                elif parent_pcode:
                     try:
-                        parent = get_location_model().objects.get(p_code=parent_pcode, is_active=True)
+                        parent = get_location_model().objects.lean().get(p_code=parent_pcode, is_active=True)
                         default_dict["parent"] = parent
                     except (get_location_model().DoesNotExist, get_location_model().MultipleObjectsReturned):
                         skipped += 1
@@ -57,12 +109,17 @@ class LocationSynchronizer:
                         continue
 
                 try:
-                    location, created = get_location_model().objects.get_or_create(
-                        p_code=pcode, is_active=True, defaults=default_dict
+                    location, created = (
+                        get_location_model()
+                        .objects.lean()
+                        .get_or_create(p_code=pcode, is_active=True, defaults=default_dict)
                     )
                     if created:
                         new += 1
                     else:
+                        if location.geom_hash == geometry.fingerprint:
+                            # unchanged geometry, left deferred and not rewritten
+                            del default_dict[geom_key]
                         for attr, value in default_dict.items():
                             setattr(location, attr, value)
                         location.save()
@@ -83,56 +140,190 @@ class LocationSynchronizer:
 
         return new, updated, skipped, error
 
-    def query_with_retries(self, query, offset, max_retries=5):
+    def preprocess_geometries(self, rows):
         """
-        Query CartoDB with retries
+        Parse, validate (and repair, simplify) and fingerprint the geometries of all the rows in parallel
         """
-        retries = 0
-        while retries < max_retries:
-            time.sleep(0.1)
-            retries += 1
-            try:
-                sites = self.sql_client.send(query)
-            except CartoException:
-                if retries < max_retries:
-                    logger.warning("Retrying again table page at offset {}".format(offset))
+        return preprocess_geometries(
+            [row["the_geom"] for row in rows],
+            repair=self.carto.repair_geometries,
+            tolerance=self.carto.simplify_tolerance,
+            encoding=self.geometry_encoding,
+        )
+
+    def assign_parents_spatially(self, rows, geometries):
+        """
+        Find the parent of every row as the active location of the parent level containing
+        the representative point of its geometry, in one bulk spatial join.
+        Ambiguous and unmatched rows are recorded in `parent_report`, and skipped.
+        Returns the parent of the matched rows, by row index.
+        """
+        logging.info("Assign parents spatially")
+        parent_level = self.carto.parent.admin_level if self.carto.parent else self.carto.admin_level - 1
+        located = locate_points([geometry.point for geometry in geometries], parent_level)
+        parents = get_location_model().objects.lean().in_bulk({pk for pks in located for pk in pks})
+
+        matched, ambiguous, unmatched = {}, {}, []
+        for i, (row, geometry, pks) in enumerate(zip(rows, geometries, located)):
+            pcode = row[self.carto.pcode_col]
+            if geometry.point is None:
+                continue
+            if len(pks) == 1:
+                matched[i] = parents[pks[0]]
+            elif pks:
+                ambiguous[pcode] = sorted(parents[pk].p_code for pk in pks)
+            else:
+                unmatched.append(pcode)
+
+        self.parent_report = {"matched": len(matched), "ambiguous": ambiguous, "unmatched": unmatched}
+        logger.info(f"Spatial parents: {len(matched)} matched, {len(ambiguous)} ambiguous, {len(unmatched)} unmatched")
+        for pcode, parent_pcodes in ambiguous.items():
+            logger.warning(f"Ambiguous parent for pcode {pcode}: {', '.join(parent_pcodes)}")
+        if unmatched:
+            logger.warning(f"No parent found for pcodes: {', '.join(unmatched)}")
+        return matched
 
-            if "error" in sites:
-                raise CartoException("Invalid CartoDBTable")
-            return sites["rows"]
-        raise CartoException("Cannot connect to CartoDB")
+    def send(self, query):
+        """
+        Query CartoDB with the retry policy
+        """
+        return self.retry_policy.call(self.carto.domain, self.sql_client.send, query)
+
+    def query_with_retries(self, query, offset, max_retries=None):
+        """
+        Query a page of CartoDB with retries
+        """
+        policy = self.retry_policy if max_retries is None else get_retry_policy(max_attempts=max_retries)
+        try:
+            sites = policy.call(self.carto.domain, self.sql_client.send, query)
+        except CartoException:
+            logger.warning(f"Cannot fetch the table page at offset {offset}")
+            raise
+        if "error" in sites:
+            raise CartoException("Invalid CartoDBTable")
+        return sites["rows"]
+
+    def get_data_version(self, row_count, max_id):
+        """
+        Version of the Carto table data, for the page cache: the last update time from the
+        Carto table metadata, with the number of rows and the highest id.
+        None (the cache is not used) when the last update time cannot be read.
+        """
+        if not conf.CARTO_CACHE_DIR:
+            return None
+        try:
+            rows = self.send(
+                f"select updated_at from CDB_TableMetadata where tabname = '{self.carto.table_name}'::regclass"
+            )["rows"]
+            updated_at = rows[0].get("updated_at") if rows else None
+        except (CartoException, KeyError):
+            updated_at = None
+        if not updated_at:
+            logger.info(f"Unknown last update time of {self.carto.table_name}, the page cache is not used")
+            return None
+        return f"{updated_at}-{row_count}-{max_id}"
+
+    def get_geometry_query(self):
+        """
+        Select expression of the geometry, in the transfer encoding of the table
+        """
+        encoding, precision = self.carto.geometry_encoding, self.carto.geometry_precision
+        if encoding == GEOMETRY_ENCODING_WKB:
+            return "ST_AsHexEWKB(the_geom) as the_geom"
+        if encoding == GEOMETRY_ENCODING_TWKB:
+            precision = DEFAULT_TWKB_PRECISION if precision is None else precision
+            return f"encode(ST_AsTWKB(the_geom, {precision}), 'base64') as the_geom"
+        if precision is not None:
+            return f"st_AsGeoJSON(the_geom, {precision}) as the_geom"
+        return "st_AsGeoJSON(the_geom) as the_geom"
+
+    def get_base_query(self, geometry=None):
+        geometry = geometry or self.get_geometry_query()
+        parent_qry = f", {self.carto.parent_code_col}" if self.carto.parent_code_col and self.carto.parent else ""
+        return (
+            f"select {geometry}, {self.carto.name_col}, "
+            f"{self.carto.pcode_col}{parent_qry} from {self.carto.table_name}"
+        )
 
     def get_cartodb_locations(self, cartodb_id_col="cartodb_id"):
         """returns locations referenced by cartodb_table"""
-        rows = []
+        if self.carto.fetch_backend != FETCH_BACKEND_PAGINATED:
+            try:
+                return self.get_cartodb_locations_export(self.carto.fetch_backend)
+            except (CartoException, requests.RequestException, ValueError, csv.Error) as e:
+                logger.warning(f"Carto export of {self.carto.table_name} failed ({e}), using paginated requests")
+        return self.get_cartodb_locations_paginated(cartodb_id_col)
+
+    def get_cartodb_locations_export(self, export_format):
+        """
+        Fetch all the rows with a single streamed Carto export (the page cache is not used)
+        """
+        logger.info(f"Requesting the {export_format} export of {self.carto.table_name}")
+        # the geojson export builds the features from the raw the_geom column
+        query = self.get_base_query("the_geom") if export_format == GEOJSON else self.get_base_query()
+        rows = self.retry_policy.call(
+            self.carto.domain, fetch_export, self.sql_client.auth_client, query, export_format
+        )
+        if export_format == GEOJSON:
+            self.geometry_encoding = GEOMETRY_ENCODING_GEOJSON
+        logger.info(f"Received {len(rows)} rows from the export of {self.carto.table_name}")
+        return rows
+
+    def get_pagination(self, cartodb_id_col="cartodb_id"):
+        """
+        Number of rows and highest cartodb_id of the table, with the number of ids per page
+        """
         try:
-            row_count = self.sql_client.send(f"select count(*) from {self.carto.table_name}")["rows"][0]["count"]
-            max_id = self.sql_client.send(f"select MAX({cartodb_id_col}) from {self.carto.table_name}")["rows"][0][
-                "max"
-            ]
+            row_count = self.send(f"select count(*) from {self.carto.table_name}")["rows"][0]["count"]
+            max_id = self.send(f"select MAX({cartodb_id_col}) from {self.carto.table_name}")["rows"][0]["max"]
         except CartoException:  # pragma: no-cover
             message = f"Cannot fetch pagination prerequisites from CartoDB for table {self.carto.table_name}"
             logger.exception(message)
             raise CartoException(message)
 
-        offset, limit = 0, 100
-
+        max_id, limit = max_id or 0, 100
         # failsafe in the case when cartodb id's are too much off compared to the nr. of records
         if max_id > (5 * row_count):
             limit = max_id + 1
             logger.warning("The CartoDB primary key seems off, pagination is not possible")
+        return row_count, max_id, limit
 
-        parent_qry = f", {self.carto.parent_code_col}" if self.carto.parent_code_col and self.carto.parent else ""
-        base_qry = (
-            f"select st_AsGeoJSON(the_geom) as the_geom, {self.carto.name_col}, "
-            f"{self.carto.pcode_col}{parent_qry} from {self.carto.table_name}"
-        )
+    def get_page_plan(self, cartodb_id_col="cartodb_id"):
+        """
+        Ranges (start, stop, limit) of cartodb_id splitting the table in chunks, fetched by the distributed import
+        """
+        row_count, max_id, limit = self.get_pagination(cartodb_id_col)
+        # whole pages per chunk, so that the pages of the chunks do not overlap
+        chunk_size = -(-conf.IMPORT_CHUNK_SIZE // limit) * limit
+        return [(start, min(start + chunk_size, max_id), limit) for start in range(0, max_id, chunk_size)]
+
+    def get_cartodb_locations_paginated(self, cartodb_id_col="cartodb_id"):
+        """
+        Fetch the rows in pages of cartodb_id, one SQL API request per page
+        """
+        row_count, max_id, limit = self.get_pagination(cartodb_id_col)
+        self.page_cache = CartoPageCache.for_table(self.carto, self.get_data_version(row_count, max_id))
+        if self.page_cache:
+            self.page_cache.log_resume()
+        return self.fetch_pages(0, max_id, limit, cartodb_id_col)
 
-        while offset <= max_id:
+    def fetch_pages(self, start, stop, limit, cartodb_id_col="cartodb_id"):
+        """
+        Fetch the rows with start < cartodb_id <= stop, in pages of `limit` ids
+        """
+        rows, offset = [], start
+        base_qry = self.get_base_query()
+
+        while offset < stop:
             logger.info(f"Requesting rows between {offset} and {offset + limit} for {self.carto.table_name}")
             paged_qry = base_qry + f" WHERE {cartodb_id_col} > {offset} AND {cartodb_id_col} <= {offset + limit}"
-            time.sleep(0.1)  # do not spam Carto with requests
-            new_rows = self.query_with_retries(paged_qry, offset)
+            new_rows = self.page_cache.get(paged_qry) if self.page_cache else None
+            if new_rows is None:
+                time.sleep(0.1)  # do not spam Carto with requests
+                new_rows = self.query_with_retries(paged_qry, offset)
+                if self.page_cache:
+                    self.page_cache.set(paged_qry, new_rows)
+                    self.page_cache.save_checkpoint(offset + limit)
             rows += new_rows
             offset += limit
 
@@ -145,10 +336,8 @@ class LocationSynchronizer:
         - delete non referenced locations
         """
         logging.info("Clean Obsolate Locations")
-        for location in get_location_model().objects.filter(p_code__in=to_deactivate):
-            collector = NestedObjects(using="default")
-            collector.collect([location])
-            if location in collector.edges:
+        for location in get_location_model().objects.lean().filter(p_code__in=to_deactivate):
+            if is_referenced(location):
                 location.name = f"{location.name} [{datetime.today().strftime('%Y-%m-%d')}]"
                 location.is_active = False
                 location.save()
@@ -165,14 +354,18 @@ class LocationSynchronizer:
         for old, new in old2new.items():
             if old != new:
                 try:
-                    old_location = get_location_model().objects.get(p_code=old, is_active=True)
+                    old_location = get_location_model().objects.lean().get(p_code=old, is_active=True)
                 except get_location_model().DoesNotExist:
                     raise InvalidRemap(f"Old location {old} does not exist or is not active")
                 except get_location_model().MultipleObjectsReturned:
-                    locs = ", ".join([loc.name for loc in self.model.objects.filter(p_code=old)])
+                    locs = ", ".join([loc.name for loc in get_location_model().objects.lean().filter(p_code=old)])
                     raise InvalidRemap(f"Multiple active Location exist for pcode {old}: {locs}")
                 old_location.p_code = new
-                old_location.save()
+                try:
+                    with transaction.atomic():
+                        old_location.save()
+                except IntegrityError:
+                    raise InvalidRemap(f"Cannot remap {old} -> {new}, an active location {new} already exists")
                 logger.info(f"Update through remapping {old} -> {new}")
 
     def clean_upper_level(self):
@@ -182,11 +375,9 @@ class LocationSynchronizer:
         - deactivate if all children are inactive (doesn't exist an active child)
         """
         logging.info("Clean upper level")
-        qs = get_location_model().objects.filter(admin_level=self.carto.admin_level - 1, is_active=False)
+        qs = get_location_model().objects.lean().filter(admin_level=self.carto.admin_level - 1, is_active=False)
         for location in qs:
-            collector = NestedObjects(using="default")
-            collector.collect([location])
-            if location not in collector.edges:
+            if not is_referenced(location):
                 if location.is_leaf_node():
                     location.delete()
                     logger.info(f"Deleting parent {location}")
@@ -197,15 +388,48 @@ class LocationSynchronizer:
                 #         location.save()
                 #         logger.info(f'Deactivating parent {location}')
 
-    def sync(self):
+    def refresh_geometries(self):
+        """
+        Refresh in bulk the data derived from the geometries of the synchronized admin level
+        """
+        logging.info("Refresh geometries")
+        refresh_geometries(get_location_model().objects.filter(admin_level=self.carto.admin_level))
+
+    def repair_geometries(self):
+        """
+        Make the invalid geometries of the synchronized admin level valid
+        """
+        logging.info("Repair geometries")
+        repair_geometries(get_location_model().objects.filter(admin_level=self.carto.admin_level))
+
+    def refresh_ancestry(self):
+        """
+        Rebuild in bulk the names and ancestry paths of the synchronized admin level and of the levels below it
+        """
+        logging.info("Refresh ancestry")
+        refresh_ancestry(get_location_model().objects.filter(admin_level__gte=self.carto.admin_level))
+
+    def sync(self, rows=None, geometries=None):
+        """
+        Synchronize the locations with the Carto table, from the prefetched `rows` and `geometries` if given
+        """
         try:
-            with transaction.atomic():
-                old2new, to_deactivate = get_remapping(self.sql_client, self.carto)
+            with transaction.atomic(), defer_geometry_refresh():
+                old2new, to_deactivate = get_remapping(self.sql_client, self.carto, self.retry_policy)
                 self.handle_obsolete_locations(to_deactivate)
                 self.apply_remap(old2new)
-                new, updated, skipped, error = self.create_or_update_locations()
+                new, updated, skipped, error = self.create_or_update_locations(rows, geometries)
                 self.clean_upper_level()
-                return new, updated, skipped, error
+                if self.carto.repair_geometries:
+                    self.repair_geometries()
+                self.refresh_geometries()
+                self.refresh_ancestry()
+                # the bulk refresh and repair do not send post_save
+                invalidate_cache_on_commit()
+            if self.page_cache:
+                self.page_cache.clear()
+            logger.info(f"Carto requests of {self.carto.domain}: {get_stats(self.carto.domain)}")
+            return new, updated, skipped, error
 
         except CartoException as e:
             logger.error(str(e))
@@ -1,12 +1,61 @@
 import celery
 from celery.utils.log import get_task_logger
 
+from unicef_locations.config import conf
+from unicef_locations.preprocessing import dump_prepared, load_prepared
+from unicef_locations.snapshots import build_snapshots
 from unicef_locations.synchronizers import LocationSynchronizer
 
 logger = get_task_logger(__name__)
 
 
 @celery.current_app.task(bind=True)
-def import_locations(self, carto_table_pk):
-    """Import locations from carto"""
+def import_locations(self, carto_table_pk, distributed=None):
+    """Import locations from carto, in parallel subtasks if `distributed` (UNICEF_LOCATIONS_IMPORT_DISTRIBUTED)"""
+    if conf.IMPORT_DISTRIBUTED if distributed is None else distributed:
+        return import_locations_distributed(carto_table_pk)
     LocationSynchronizer(carto_table_pk).sync()
+
+
+@celery.current_app.task
+def import_locations_distributed(carto_table_pk):
+    """
+    Coordinator of the distributed import: splits the Carto table in cartodb_id ranges fetched and
+    preprocessed by parallel subtasks, whose results are applied by a single merge task (chord)
+    """
+    synchronizer = LocationSynchronizer(carto_table_pk)
+    plan = synchronizer.get_page_plan()
+    logger.info(f"Importing {synchronizer.carto.table_name} in {len(plan)} chunks")
+    if not plan:
+        return merge_locations_chunks.delay([], carto_table_pk).id
+    header = [fetch_locations_chunk.s(carto_table_pk, start, stop, limit) for start, stop, limit in plan]
+    return celery.chord(header)(merge_locations_chunks.s(carto_table_pk)).id
+
+
+@celery.current_app.task
+def fetch_locations_chunk(carto_table_pk, start, stop, limit):
+    """Fetch and preprocess the rows of the Carto table with start < cartodb_id <= stop"""
+    synchronizer = LocationSynchronizer(carto_table_pk)
+    rows = synchronizer.fetch_pages(start, stop, limit)
+    geometries = dump_prepared(synchronizer.preprocess_geometries(rows))
+    for row in rows:
+        # the prepared WKB replaces the source geometry, only its presence is needed by the merge
+        row["the_geom"] = bool(row["the_geom"])
+    return {"rows": rows, "geometries": geometries}
+
+
+@celery.current_app.task
+def merge_locations_chunks(chunks, carto_table_pk):
+    """
+    Apply the fetched chunks, in cartodb_id order: the obsolete, remap, create/update, clean and
+    refresh phases run in order in one transaction, as in the single task import
+    """
+    rows = [row for chunk in chunks for row in chunk["rows"]]
+    geometries = [geometry for chunk in chunks for geometry in load_prepared(chunk["geometries"])]
+    return LocationSynchronizer(carto_table_pk).sync(rows, geometries)
+
+
+@celery.current_app.task
+def build_locations_snapshots():
+    """Build the static snapshots of the location lists"""
+    build_snapshots()
@@ -0,0 +1,120 @@
+"""
+Decoder of the Tiny WKB geometries (``ST_AsTWKB``) into the standard 2D WKB understood by GEOS and shapely.
+
+TWKB stores the coordinates as varint encoded deltas rounded at a given precision, which makes it
+several times smaller than GeoJSON or WKB. The whole varint stream of a geometry is decoded in one
+pass and the deltas are accumulated per dimension; the Z and M dimensions are dropped.
+"""
+
+import struct
+from itertools import accumulate
+
+POINT, LINESTRING, POLYGON, MULTIPOINT, MULTILINESTRING, MULTIPOLYGON = range(1, 7)
+HAS_BBOX, HAS_SIZE, HAS_IDLIST, HAS_EXTENDED_DIMS, IS_EMPTY = 0x01, 0x02, 0x04, 0x08, 0x10
+
+
+def zigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def read_varints(data):
+    values, value, shift = [], 0, 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    if shift:
+        raise ValueError("Truncated TWKB varint")
+    return values
+
+
+def wkb_header(geom_type):
+    return struct.pack("<BI", 1, geom_type)
+
+
+class _Decoder:
+    def __init__(self, values, position, dimensions, precision):
+        self.values = values
+        self.position = position
+        self.dimensions = dimensions
+        self.factor = 10.0**precision
+        self.last = [0] * dimensions
+
+    def read(self):
+        try:
+            value = self.values[self.position]
+        except IndexError:
+            raise ValueError("Truncated TWKB geometry")
+        self.position += 1
+        return value
+
+    def read_points(self, count):
+        start, step = self.position, self.dimensions
+        end = start + count * step
+        if end > len(self.values):
+            raise ValueError("Truncated TWKB geometry")
+        deltas = self.values[start:end]
+        self.position = end
+        axes = []
+        for axis in range(step):
+            # the deltas run from the last point of the previous ring or part
+            coordinates = list(accumulate((zigzag(delta) for delta in deltas[axis::step]), initial=self.last[axis]))
+            self.last[axis] = coordinates[-1]
+            axes.append(coordinates[1:])
+        factor = self.factor
+        return struct.pack(f"<{2 * count}d", *(value / factor for point in zip(*axes[:2]) for value in point))
+
+    def read_body(self, geom_type):
+        if geom_type == POINT:
+            return wkb_header(POINT) + self.read_points(1)
+        if geom_type == LINESTRING:
+            count = self.read()
+            return wkb_header(LINESTRING) + struct.pack("<I", count) + self.read_points(count)
+        if geom_type == POLYGON:
+            rings = self.read()
+            parts = [wkb_header(POLYGON), struct.pack("<I", rings)]
+            for _ in range(rings):
+                count = self.read()
+                parts += [struct.pack("<I", count), self.read_points(count)]
+            return b"".join(parts)
+        raise ValueError(f"Unsupported TWKB geometry type {geom_type}")
+
+    def read_multi(self, geom_type, has_idlist):
+        count = self.read()
+        if has_idlist:
+            self.position += count
+        parts = [self.read_body(geom_type - 3) for _ in range(count)]
+        return wkb_header(geom_type) + struct.pack("<I", count) + b"".join(parts)
+
+
+def to_wkb(data):
+    """
+    2D WKB (little endian) of the TWKB geometry `data` (bytes), ValueError if it cannot be decoded
+    """
+    if len(data) < 2:
+        raise ValueError("Truncated TWKB geometry")
+    geom_type, precision, flags = data[0] & 0x0F, zigzag(data[0] >> 4), data[1]
+    if not POINT <= geom_type <= MULTIPOLYGON:
+        raise ValueError(f"Unsupported TWKB geometry type {geom_type}")
+
+    position, dimensions = 2, 2
+    if flags & HAS_EXTENDED_DIMS:
+        if len(data) < 3:
+            raise ValueError("Truncated TWKB geometry")
+        dimensions += (data[2] & 0x01) + (data[2] >> 1 & 0x01)
+        position += 1
+    if flags & IS_EMPTY:
+        if geom_type == POINT:
+            return wkb_header(POINT) + struct.pack("<2d", float("nan"), float("nan"))
+        return wkb_header(geom_type) + struct.pack("<I", 0)
+
+    values = read_varints(memoryview(data)[position:])
+    # the size and the bounding box are not needed to decode the geometry
+    start = (1 if flags & HAS_SIZE else 0) + (2 * dimensions if flags & HAS_BBOX else 0)
+    decoder = _Decoder(values, start, dimensions, precision)
+    if geom_type >= MULTIPOINT:
+        return decoder.read_multi(geom_type, flags & HAS_IDLIST)
+    return decoder.read_body(geom_type)
@@ -18,6 +18,11 @@ urlpatterns = [
         views.LocationsViewSet.as_view({"get": "retrieve"}),
         name="locations_detail_pcode",
     ),
+    re_path(
+        r"^locations/export/(?P<export_format>csv|geojson|gpkg)/$",
+        views.LocationExportView.as_view(),
+        name="locations_export",
+    ),
     re_path(r"^cartodbtables/$", views.CartoDBTablesView.as_view(), name="cartodbtables"),
     re_path(r"^autocomplete/$", views.LocationQuerySetView.as_view(), name="locations_autocomplete"),
 ]
@@ -2,6 +2,7 @@ from carto.exceptions import CartoException
 from celery.utils.log import get_task_logger
 from django.apps import apps
 from django.conf import settings
+from django.db.models import Count
 
 from unicef_locations.exceptions import InvalidRemap
 
@@ -14,13 +15,59 @@ def get_location_model():
     return get_model(settings.UNICEF_LOCATIONS_MODEL)
 
 
-def get_remapping(sql_client, carto_table):
+def build_tree(nodes):
+    """
+    Nests serialized locations, given in tree order (parents before children), in O(n).
+    Returns the list of the nodes whose parent is not part of `nodes`.
+    """
+    roots = []
+    by_id = {}
+    for node in nodes:
+        node["children"] = []
+        by_id[str(node["id"])] = node
+        parent = by_id.get(str(node["parent"]))
+        if parent is None:
+            roots.append(node)
+        else:
+            parent["children"].append(node)
+    return roots
+
+
+def deactivate_duplicate_pcodes(model):
+    """
+    Archives all but the most recently modified active location of every duplicated p_code, which the
+    unique active p_code constraint rejects: to be run by a data migration (with the historical location
+    `model`) before the constraint is added. Returns the archived locations as (pk, p_code) pairs.
+    """
+    manager = model._default_manager
+    duplicated = (
+        manager.filter(is_active=True)
+        .exclude(p_code="")
+        .values("p_code")
+        .annotate(count=Count("pk"))
+        .filter(count__gt=1)
+        .values_list("p_code", flat=True)
+    )
+    archived = []
+    for p_code in duplicated:
+        pks = manager.filter(p_code=p_code, is_active=True).order_by("-modified", "-pk").values_list("pk", flat=True)
+        archived += [(pk, p_code) for pk in pks[1:]]
+    if archived:
+        manager.filter(pk__in=[pk for pk, __ in archived]).update(is_active=False)
+        logger.warning(f"Archived {len(archived)} locations with a duplicated active p_code: {archived}")
+    return archived
+
+
+def get_remapping(sql_client, carto_table, retry_policy=None):
     remap_dict = dict()
     to_deactivate = list()
     if carto_table.remap_table_name:
         try:
             remap_qry = f"select old_pcode::text, new_pcode::text, matching::int from {carto_table.remap_table_name}"
-            remap_table = sql_client.send(remap_qry)["rows"]
+            if retry_policy:
+                remap_table = retry_policy.call(carto_table.domain, sql_client.send, remap_qry)["rows"]
+            else:
+                remap_table = sql_client.send(remap_qry)["rows"]
         except CartoException as e:
             logger.exception(str(e))
             raise CartoException
@@ -1,12 +1,95 @@
+import os
+import tempfile
+
 from django.core.exceptions import ValidationError
-from django.shortcuts import get_object_or_404
-from rest_framework import mixins, viewsets
-from rest_framework.generics import ListAPIView
+from django.db.models import BooleanField, ExpressionWrapper, F, Q
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework import exceptions, mixins, viewsets
+from rest_framework.decorators import action
+from rest_framework.generics import GenericAPIView, get_object_or_404, ListAPIView
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
 
+from . import exports, snapshots
 from .cache import etag_cached
+from .config import conf
+from .filters import LocationFilterBackend
+from .geometry import get_resolution
 from .models import CartoDBTable
-from .serializers import CartoDBTableSerializer, LocationLightSerializer, LocationSerializer
-from .utils import get_location_model
+from .pagination import LocationCursorPagination
+from .renderers import get_list_renderer_classes
+from .serializers import (
+    CartoDBTableSerializer,
+    LocationBulkLookupSerializer,
+    LocationLightSerializer,
+    LocationLookupSerializer,
+    LocationSerializer,
+    LocationTreeNodeSerializer,
+)
+from .utils import build_tree, get_location_model
+
+
+class SparseFieldsetMixin:
+    """
+    Restricts the serialized fields, and the columns fetched from the database,
+    to the ones listed in the ``fields`` query parameter (e.g. ``?fields=id,p_code``)
+    """
+
+    def get_requested_fields(self):
+        value = self.request.query_params.get("fields") if self.request else None
+        if not value or self.request.method not in SAFE_METHODS:
+            return None
+        requested = [name.strip() for name in value.split(",") if name.strip()]
+        unknown = set(requested).difference(self.get_serializer_class().Meta.fields)
+        if unknown:
+            raise exceptions.ValidationError({"fields": "Unknown fields: {}".format(", ".join(sorted(unknown)))})
+        return requested
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["fields"] = self.get_requested_fields()
+        return context
+
+    def restrict_columns(self, queryset):
+        requested = self.get_requested_fields()
+        if requested is None:
+            return queryset
+        field_columns = self.get_serializer_class().Meta.field_columns
+        columns = {column for name in requested for column in field_columns[name]}
+        return queryset.select_related(None).only(*columns)
+
+
+class ListRenderersMixin:
+    """
+    Renders the lists as JSON or in the compact formats negotiated on the Accept header
+    """
+
+    def get_renderers(self):
+        # resolved per request, so that the settings overrides apply
+        return [renderer() for renderer in get_list_renderer_classes()]
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        patch_vary_headers(response, ["Accept"])
+        return response
+
+
+class SnapshotMixin:
+    """
+    Serves the unfiltered JSON list from its static snapshot, when snapshots are enabled
+    """
+
+    snapshot_variant = None
+
+    def get_snapshot_response(self):
+        if not conf.SNAPSHOT_MODE or self.request.query_params or self.request.accepted_renderer.format != "json":
+            return None
+        return snapshots.get_snapshot_response(self.snapshot_variant)
+
+    @etag_cached("locations")
+    def list(self, request, *args, **kwargs):
+        return self.get_snapshot_response() or super().list(request, *args, **kwargs)
 
 
 class CartoDBTablesView(ListAPIView):
@@ -19,6 +102,9 @@ class CartoDBTablesView(ListAPIView):
 
 
 class LocationsViewSet(
+    ListRenderersMixin,
+    SnapshotMixin,
+    SparseFieldsetMixin,
     mixins.RetrieveModelMixin,
     mixins.ListModelMixin,
     mixins.CreateModelMixin,
@@ -29,12 +115,11 @@ class LocationsViewSet(
     CRUD for Locations
     """
 
-    queryset = get_location_model().objects.all()
+    snapshot_variant = "locations"
+    queryset = get_location_model().objects.lean()
     serializer_class = LocationSerializer
-
-    @etag_cached("locations")
-    def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+    filter_backends = [LocationFilterBackend]
+    pagination_class = LocationCursorPagination
 
     def get_object(self):
         if "p_code" in self.kwargs:
@@ -44,8 +129,100 @@ class LocationsViewSet(
         else:
             return super().get_object()
 
+    def get_tree_node(self):
+        """
+        Fetches only the MPTT fields of the requested location, to build range queries on them
+        (404 for an unknown or malformed pk)
+        """
+        queryset = get_location_model().objects.lean().only("tree_id", "lft", "rght", "level")
+        return get_object_or_404(queryset, pk=self.kwargs["pk"])
+
+    def get_tree_queryset(self, queryset):
+        return queryset.lean().order_by("tree_id", "lft")
+
+    @action(detail=True)
+    @etag_cached("locations")
+    def descendants(self, request, *args, **kwargs):
+        queryset = self.get_tree_queryset(self.get_tree_node().get_descendants())
+        return Response(LocationLightSerializer(queryset, many=True).data)
+
+    @action(detail=True)
+    @etag_cached("locations")
+    def ancestors(self, request, *args, **kwargs):
+        queryset = self.get_tree_queryset(self.get_tree_node().get_ancestors())
+        return Response(LocationLightSerializer(queryset, many=True).data)
+
+    @action(detail=True)
+    @etag_cached("locations")
+    def tree(self, request, *args, **kwargs):
+        """
+        Nested export of the subtree rooted in the location
+        """
+        queryset = self.get_tree_queryset(self.get_tree_node().get_descendants(include_self=True))
+        return Response(build_tree(LocationLightSerializer(queryset, many=True).data)[0])
+
+    def get_tree_level_queryset(self, **filters):
+        """
+        One level of the tree, each node annotated with the size of its subtree computed from lft/rght
+        """
+        queryset = (
+            get_location_model()
+            .objects.lean()
+            .filter(**filters)
+            .annotate(
+                descendant_count=(F("rght") - F("lft") - 1) / 2,
+                has_children=ExpressionWrapper(Q(rght__gt=F("lft") + 1), output_field=BooleanField()),
+            )
+            .order_by("name")
+        )
+        return self.filter_queryset(queryset)
+
+    @action(detail=True)
+    @etag_cached("locations")
+    def children(self, request, *args, **kwargs):
+        queryset = self.get_tree_level_queryset(parent=self.get_tree_node())
+        return Response(LocationTreeNodeSerializer(queryset, many=True).data)
+
+    @action(detail=False)
+    @etag_cached("locations")
+    def roots(self, request, *args, **kwargs):
+        queryset = self.get_tree_level_queryset(parent__isnull=True)
+        return Response(LocationTreeNodeSerializer(queryset, many=True).data)
+
+    @action(detail=False, methods=["post"])
+    def resolve(self, request, *args, **kwargs):
+        """
+        Resolves a batch of p-codes (active locations only) and/or ids with a single query
+        and reports the keys that were not found.
+        """
+        lookup = LocationBulkLookupSerializer(data=request.data)
+        lookup.is_valid(raise_exception=True)
+        p_codes, ids = set(lookup.validated_data["p_codes"]), set(lookup.validated_data["ids"])
+
+        queryset = (
+            get_location_model()
+            .objects.lean()
+            .filter(Q(p_code__in=p_codes, is_active=True) | Q(pk__in=ids))
+            .only(*LocationLookupSerializer.Meta.fields)
+            .order_by()
+        )
+        results = LocationLookupSerializer(queryset, many=True).data
+
+        found_p_codes = {row["p_code"] for row in results if row["is_active"]}
+        found_ids = {row["id"] for row in results}
+        return Response(
+            {
+                "results": results,
+                "not_found": {
+                    "p_codes": sorted(p_codes - found_p_codes),
+                    "ids": sorted(ids - found_ids),
+                },
+            }
+        )
+
     def get_queryset(self):
-        queryset = get_location_model().objects.all()
+        # names and geo_point are served from stored columns, neither geom nor the parent row is needed
+        queryset = get_location_model().objects.lean()
         if "values" in self.request.query_params.keys():
             # Used for ghost data - filter in all(), and return straight away.
             try:
@@ -54,36 +231,74 @@ class LocationsViewSet(
                 raise ValidationError("ID values must be integers")
             else:
                 queryset = queryset.filter(id__in=ids)
-        return queryset
+        return self.restrict_columns(queryset)
 
 
-class LocationsLightViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+class LocationsLightViewSet(
+    ListRenderersMixin, SnapshotMixin, SparseFieldsetMixin, mixins.ListModelMixin, viewsets.GenericViewSet
+):
     """
     Returns a list of all Locations with restricted field set.
     """
 
-    queryset = get_location_model().objects.defer(
-        "geom",
-    )
+    snapshot_variant = "locations-light"
+    queryset = get_location_model().objects.lean()
     serializer_class = LocationLightSerializer
+    filter_backends = [LocationFilterBackend]
+    pagination_class = LocationCursorPagination
 
-    @etag_cached("locations")
-    def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+    def get_queryset(self):
+        return self.restrict_columns(super().get_queryset())
 
 
-class LocationQuerySetView(ListAPIView):
+class LocationQuerySetView(SparseFieldsetMixin, ListAPIView):
     model = get_location_model()
     serializer_class = LocationLightSerializer
 
     def get_queryset(self):
         q = self.request.query_params.get("q")
-        qs = self.model.objects.defer(
-            "geom",
-        )
+        qs = self.restrict_columns(self.model.objects.lean())
 
         if q:
             qs = qs.filter(name__icontains=q)
 
         # return maximum 7 records
         return qs.all()[:7]
+
+
+class LocationExportView(GenericAPIView):
+    """
+    Streams the (filtered) locations as CSV, newline-delimited GeoJSON or GeoPackage,
+    with the geometries simplified at ``?resolution=coarse|medium|fine`` if requested
+    """
+
+    filter_backends = [LocationFilterBackend]
+
+    def get_queryset(self):
+        return exports.get_export_queryset()
+
+    def get(self, request, export_format, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            resolution = get_resolution(request.query_params)
+        except ValueError as e:
+            raise exceptions.ValidationError({"resolution": str(e)})
+        filename = f"locations.{export_format}"
+
+        if export_format == exports.GEOPACKAGE:
+            if exports.fiona is None:
+                raise exceptions.NotAcceptable("GeoPackage export is not available")
+            with tempfile.TemporaryDirectory() as tmpdir:
+                path = os.path.join(tmpdir, filename)
+                exports.write_geopackage(queryset, path, resolution=resolution)
+                # the open handle keeps the file readable once the directory is removed
+                response = FileResponse(open(path, "rb"), as_attachment=True, filename=filename)
+            return response
+
+        if export_format == exports.CSV:
+            iterator = exports.iter_csv(queryset)
+        else:
+            iterator = exports.iter_geojson(queryset, resolution)
+        response = StreamingHttpResponse(iterator, content_type=exports.CONTENT_TYPES[export_format])
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
@@ -4,13 +4,16 @@ from unicef_locations.tests.factories import LocationFactory
 
 
 @pytest.fixture()
-def location(db):
-    return LocationFactory()
+def location(db, django_capture_on_commit_callbacks):
+    # the cache is invalidated when the fixture data is "committed", not by the changes of the test
+    with django_capture_on_commit_callbacks(execute=True):
+        return LocationFactory()
 
 
 @pytest.fixture()
-def locations3(db):
-    return [LocationFactory() for _ in range(3)]
+def locations3(db, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        return [LocationFactory() for _ in range(3)]
 
 
 @pytest.fixture()
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+from unicef_locations.utils import deactivate_duplicate_pcodes
+
+
+def archive_duplicate_pcodes(apps, schema_editor):
+    # the existing duplicates would make the unique active p_code constraint fail
+    deactivate_duplicate_pcodes(apps.get_model('sample', 'Location'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sample', '0002_location_representative_point'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['p_code', 'is_active'], name='sample_location_pcode_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['admin_level', 'is_active'], name='sample_location_level_idx'),
+        ),
+        migrations.RunPython(archive_duplicate_pcodes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='location',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True), models.Q(('p_code', ''), _negated=True)), fields=('p_code',), name='sample_location_active_pcode'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sample', '0003_location_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='display_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=512, verbose_name='Display Name'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='full_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=1024, verbose_name='Full Name'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='ancestry_pcodes',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Ancestry P Codes'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='ancestry_names',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Ancestry Names'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['ancestry_pcodes'], name='sample_location_ancestry_idx', opclasses=['text_pattern_ops']),
+        ),
+    ]
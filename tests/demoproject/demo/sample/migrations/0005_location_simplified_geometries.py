@@ -0,0 +1,27 @@
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sample', '0004_location_ancestry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='geom_coarse',
+            field=django.contrib.gis.db.models.fields.MultiPolygonField(blank=True, editable=False, null=True, srid=4326, verbose_name='Coarse Geometry'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='geom_medium',
+            field=django.contrib.gis.db.models.fields.MultiPolygonField(blank=True, editable=False, null=True, srid=4326, verbose_name='Medium Geometry'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='geom_fine',
+            field=django.contrib.gis.db.models.fields.MultiPolygonField(blank=True, editable=False, null=True, srid=4326, verbose_name='Fine Geometry'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sample', '0005_location_simplified_geometries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='bbox_xmin',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Bounding Box X Min'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='bbox_ymin',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Bounding Box Y Min'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='bbox_xmax',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Bounding Box X Max'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='bbox_ymax',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Bounding Box Y Max'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='area',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='Area'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='is_valid',
+            field=models.BooleanField(blank=True, editable=False, null=True, verbose_name='Valid Geometry'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['bbox_xmin', 'bbox_xmax', 'bbox_ymin', 'bbox_ymax'], name='sample_location_bbox_idx'),
+        ),
+    ]
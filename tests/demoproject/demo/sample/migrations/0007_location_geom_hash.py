@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sample', '0006_location_geometry_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='geom_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40, verbose_name='Geometry Hash'),
+        ),
+    ]
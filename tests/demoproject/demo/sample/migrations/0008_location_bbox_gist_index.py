@@ -0,0 +1,25 @@
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+import unicef_locations.geometry
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sample', '0007_location_geom_hash'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='location',
+            name='sample_location_bbox_idx',
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=django.contrib.postgres.indexes.GistIndex(
+                unicef_locations.geometry.MakeEnvelope('bbox_xmin', 'bbox_ymin', 'bbox_xmax', 'bbox_ymax', 4326),
+                name='sample_location_bbox_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations
+
+from unicef_locations.ancestry import refresh_ancestry
+
+
+def backfill_ancestry(apps, schema_editor):
+    # the names of the rows created before 0004 are not computed by the serializers
+    refresh_ancestry(apps.get_model('sample', 'Location')._default_manager.all())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sample', '0008_location_bbox_gist_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_ancestry, migrations.RunPython.noop),
+    ]
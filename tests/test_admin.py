@@ -1,7 +1,12 @@
+from django.contrib import admin
+from django.contrib.gis.geos import GEOSGeometry
 from django.urls import reverse
 
 import pytest
 
+from unicef_locations.tests.factories import LocationFactory
+from unicef_locations.utils import get_location_model
+
 pytestmark = pytest.mark.django_db
 
 
@@ -25,6 +30,24 @@ def test_admin_location_edit(django_app, admin_user, location):
     assert response
 
 
+def test_admin_location_edit_simplified(django_app, admin_user):
+    location = LocationFactory(geom=GEOSGeometry("MULTIPOLYGON(((0 0, 10 0, 10 10, 0 10, 0 0)))"))
+    geom = location.geom
+    url = reverse("admin:sample_location_change", args=[location.id])
+    response = django_app.get(f"{url}?resolution=coarse", user=admin_user)
+    response = response.forms["location_form"].submit()
+    assert response
+    location.refresh_from_db()
+    assert location.geom == geom
+
+
+def test_admin_location_map_modifiable(rf):
+    model_admin = admin.site._registry[get_location_model()]
+    geom = get_location_model()._meta.get_field("geom")
+    assert not model_admin.formfield_for_dbfield(geom, rf.get("/", {"resolution": "coarse"})).widget.modifiable
+    assert model_admin.formfield_for_dbfield(geom, rf.get("/")).widget.modifiable
+
+
 def test_admin_cartodbtable(django_app, admin_user, cartodbtable):
     url = reverse("admin:unicef_locations_cartodbtable_changelist")
     response = django_app.get(url, user=admin_user)
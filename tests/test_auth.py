@@ -0,0 +1,25 @@
+from unittest.mock import patch
+
+from unicef_locations.auth import close_carto_clients, get_carto_client
+
+
+def test_get_carto_client():
+    close_carto_clients()
+    client = get_carto_client("unicef")
+    assert client.base_url == "https://unicef.carto.com/"
+    assert get_carto_client("unicef") is client
+    assert get_carto_client("other") is not client
+
+    adapter = client.session.get_adapter(client.base_url)
+    assert adapter._pool_maxsize == 10 and adapter._pool_block
+    assert client.session.headers["Accept-Encoding"] == "gzip, deflate"
+    close_carto_clients()
+
+
+def test_carto_client_timeout(settings):
+    settings.UNICEF_LOCATIONS_CARTO_READ_TIMEOUT = 30
+    client = get_carto_client("unicef")
+    with patch("requests.Session.request") as mock_request:
+        client.send("api/v2/sql", "GET", params={"q": "select 1"})
+    assert mock_request.call_args[1]["timeout"] == (10, 30)
+    close_carto_clients()
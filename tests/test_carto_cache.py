@@ -0,0 +1,92 @@
+import pytest
+from unittest.mock import patch
+
+from unicef_locations.carto_cache import CartoPageCache
+from unicef_locations.synchronizers import LocationSynchronizer
+
+ROWS = [{"the_geom": None, "name": "Rwanda", "pcode": "RW"}]
+
+
+def test_carto_page_cache(tmp_path):
+    cache = CartoPageCache("domain", "table", "v1", root=str(tmp_path))
+    assert cache.get("select 1") is None
+
+    cache.set("select 1", ROWS)
+    cache.set("select 2", ROWS)
+    assert cache.get("select 1") == ROWS
+    # pages with the same content are stored once
+    assert len(list((tmp_path / "objects").rglob("*.json"))) == 1
+    # another version of the table doesn't see the pages
+    assert CartoPageCache("domain", "table", "v2", root=str(tmp_path)).get("select 1") is None
+
+
+def test_carto_page_cache_checkpoint(tmp_path):
+    cache = CartoPageCache("domain", "table", "v1", root=str(tmp_path))
+    assert cache.get_checkpoint() is None
+    cache.save_checkpoint(200)
+    assert cache.get_checkpoint()["offset"] == 200
+    cache.clear_checkpoint()
+    assert cache.get_checkpoint() is None
+
+
+@pytest.mark.django_db
+def test_carto_page_cache_disabled(cartodbtable):
+    assert CartoPageCache.for_table(cartodbtable, "v1") is None
+
+
+def get_response(updated_at):
+    def send(query):
+        if "CDB_TableMetadata" in query:
+            return {"rows": [{"updated_at": updated_at}]}
+        return {"rows": [{"count": 1, "max": 1, **ROWS[0]}]}
+
+    return send
+
+
+@pytest.mark.django_db
+@patch("carto.sql.SQLClient.send")
+def test_get_cartodb_locations_cached(mock_send, settings, tmp_path, cartodbtable):
+    settings.UNICEF_LOCATIONS_CARTO_CACHE_DIR = str(tmp_path)
+    mock_send.side_effect = get_response("2024-01-01T00:00:00Z")
+
+    synchronizer = LocationSynchronizer(pk=cartodbtable.pk)
+    rows = synchronizer.get_cartodb_locations()
+    assert synchronizer.page_cache.get_checkpoint()["offset"] == 100
+    calls = mock_send.call_count
+
+    # pages are read from the cache, only the pagination and version queries are sent
+    assert LocationSynchronizer(pk=cartodbtable.pk).get_cartodb_locations() == rows
+    assert mock_send.call_count == calls + 3
+
+    # a new version of the table is fetched again
+    mock_send.side_effect = get_response("2024-02-01T00:00:00Z")
+    LocationSynchronizer(pk=cartodbtable.pk).get_cartodb_locations()
+    assert mock_send.call_count == calls + 3 + calls
+
+
+@pytest.mark.django_db
+@patch("carto.sql.SQLClient.send")
+def test_get_cartodb_locations_unknown_version(mock_send, settings, tmp_path, cartodbtable):
+    settings.UNICEF_LOCATIONS_CARTO_CACHE_DIR = str(tmp_path)
+    mock_send.side_effect = get_response(None)
+
+    synchronizer = LocationSynchronizer(pk=cartodbtable.pk)
+    synchronizer.get_cartodb_locations()
+    assert synchronizer.page_cache is None
+    assert not (tmp_path / "pages").exists()
+
+
+@patch("unicef_locations.carto_cache.PRUNE_GRACE_PERIOD", -60)
+def test_carto_page_cache_clear(tmp_path):
+    cache = CartoPageCache("domain", "table", "v1", root=str(tmp_path))
+    other = CartoPageCache("domain", "other", "v1", root=str(tmp_path))
+    cache.set("select 1", ROWS)
+    cache.set("select 2", [])
+    other.set("select 1", ROWS)
+    cache.save_checkpoint(100)
+
+    cache.clear()
+    assert cache.get("select 1") is None and cache.get_checkpoint() is None
+    # the objects still referenced by the pages of other tables are kept
+    assert other.get("select 1") == ROWS
+    assert len(list((tmp_path / "objects").rglob("*.json"))) == 1
@@ -0,0 +1,119 @@
+import json
+
+import requests
+from carto.exceptions import CartoException
+
+import pytest
+from unittest.mock import MagicMock, Mock, patch
+
+from unicef_locations import retry
+from unicef_locations.carto_export import CSV, fetch_export, GEOJSON, iter_json_array
+from unicef_locations.models import FETCH_BACKEND_CSV, FETCH_BACKEND_GEOJSON
+from unicef_locations.synchronizers import LocationSynchronizer
+
+FEATURES = {
+    "type": "FeatureCollection",
+    "features": [
+        {"type": "Feature", "geometry": {"type": "Point", "coordinates": [1, 2]}, "properties": {"pcode": "RW"}},
+        {"type": "Feature", "geometry": None, "properties": {"pcode": "RW01", "name": "[Kigali], {1}"}},
+    ],
+}
+
+
+def chunked(content, size):
+    for start in range(0, len(content), size):
+        end = start + size
+        yield content[start:end]
+
+
+def get_response(content, status_code=200):
+    response = MagicMock(status_code=status_code)
+    response.iter_content.side_effect = lambda size: chunked(content, 7)
+    return response
+
+
+@pytest.mark.parametrize("size", [1, 3, 100])
+def test_iter_json_array(size):
+    content = json.dumps(FEATURES)
+    assert list(iter_json_array(chunked(content, size), "features")) == FEATURES["features"]
+
+
+def test_iter_json_array_large_feature():
+    ring = [[i / 7, -i / 3] for i in range(50000)]
+    features = [{"type": "Feature", "geometry": {"type": "Polygon", "coordinates": [ring]}, "properties": {}}]
+    content = json.dumps({"type": "FeatureCollection", "features": features * 2})
+    with patch("unicef_locations.carto_export.json.loads", side_effect=json.loads) as mock_loads:
+        assert list(iter_json_array(chunked(content, 4096), "features")) == features * 2
+    # each feature is decoded once, not again at each chunk
+    assert mock_loads.call_count == 2
+
+
+def test_iter_json_array_truncated():
+    content = json.dumps(FEATURES)[:-20]
+    with pytest.raises(ValueError):
+        list(iter_json_array([content], "features"))
+
+
+def test_fetch_export_geojson():
+    auth_client = Mock()
+    auth_client.send.return_value = get_response(json.dumps(FEATURES).encode())
+    rows = fetch_export(auth_client, "select the_geom, pcode from table", GEOJSON)
+    assert rows == [
+        {"pcode": "RW", "the_geom": '{"type": "Point", "coordinates": [1, 2]}'},
+        {"pcode": "RW01", "name": "[Kigali], {1}", "the_geom": None},
+    ]
+    assert auth_client.send.call_args[1]["params"]["format"] == GEOJSON
+
+
+def test_fetch_export_csv():
+    auth_client = Mock()
+    content = 'the_geom,name,pcode\r\n"{""type"":""Point""}","Kigali\r\nCity",RW01\r\n,Rwanda,RW\r\n'
+    auth_client.send.return_value = get_response(content.encode())
+    rows = fetch_export(auth_client, "select the_geom, pcode from table", CSV)
+    assert rows == [
+        {"the_geom": '{"type":"Point"}', "name": "Kigali\r\nCity", "pcode": "RW01"},
+        {"the_geom": None, "name": "Rwanda", "pcode": "RW"},
+    ]
+
+
+@pytest.fixture()
+def reset_retry():
+    yield
+    retry.reset()
+
+
+@pytest.mark.parametrize("status_code, retryable", [(500, True), (429, True), (400, False)])
+def test_fetch_export_error(status_code, retryable):
+    auth_client = Mock()
+    auth_client.send.return_value = get_response(b"", status_code=status_code)
+    with pytest.raises(CartoException) as error:
+        fetch_export(auth_client, "select 1", CSV)
+    assert retry.RetryPolicy().is_retryable(error.value) == retryable
+    auth_client.send.return_value.close.assert_called_once_with()
+
+
+@pytest.mark.django_db
+@patch("unicef_locations.synchronizers.fetch_export")
+def test_get_cartodb_locations_export(mock_export, cartodbtable):
+    cartodbtable.fetch_backend = FETCH_BACKEND_GEOJSON
+    cartodbtable.save()
+    mock_export.return_value = [{"the_geom": None, "name": "Rwanda", "pcode": "RW"}]
+
+    synchronizer = LocationSynchronizer(pk=cartodbtable.pk)
+    assert synchronizer.get_cartodb_locations() == mock_export.return_value
+    assert mock_export.call_args[0][1].startswith("select the_geom, ")
+
+
+@pytest.mark.django_db
+@patch("unicef_locations.synchronizers.LocationSynchronizer.get_cartodb_locations_paginated")
+@patch("unicef_locations.synchronizers.fetch_export")
+def test_get_cartodb_locations_export_fallback(mock_export, mock_paginated, settings, cartodbtable, reset_retry):
+    settings.UNICEF_LOCATIONS_CARTO_RETRY_BASE_DELAY = 0
+    cartodbtable.fetch_backend = FETCH_BACKEND_CSV
+    cartodbtable.save()
+    mock_export.side_effect = requests.ConnectionError("connection reset")
+    mock_paginated.return_value = []
+
+    synchronizer = LocationSynchronizer(pk=cartodbtable.pk)
+    assert synchronizer.get_cartodb_locations() == []
+    mock_paginated.assert_called_once_with("cartodb_id")
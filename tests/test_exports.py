@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+
+from django.contrib.gis.geos import GEOSGeometry
+from django.core.management import call_command
+from django.urls import reverse
+
+import pytest
+
+from unicef_locations.exports import iter_csv, iter_geojson
+from unicef_locations.tests.factories import LocationFactory
+from unicef_locations.utils import get_location_model
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture()
+def country():
+    country = LocationFactory(geom=GEOSGeometry("MULTIPOLYGON(((0 0, 10 0, 10 10, 0 10, 0 0)))"), point=None)
+    LocationFactory(parent=country)
+    return country
+
+
+def test_iter_csv(settings, country):
+    settings.UNICEF_LOCATIONS_EXPORT_CHUNK_SIZE = 1
+    rows = list(csv.DictReader(io.StringIO("".join(iter_csv(get_location_model().objects.all())))))
+    assert len(rows) == 2
+    assert rows[0]["p_code"] == country.p_code
+    assert "POINT" in rows[0]["geom"]
+
+
+def test_iter_geojson(country):
+    features = [json.loads(line) for line in iter_geojson(get_location_model().objects.all())]
+    assert [feature["id"] for feature in features][0] == country.pk
+    assert features[0]["geometry"]["type"] == "MultiPolygon"
+    assert features[1]["geometry"]["type"] == "Point"
+    assert "geom" not in features[0]["properties"]
+
+
+def test_api_location_export(django_app, admin_user, country):
+    url = reverse("unicef_locations:locations_export", args=["geojson"])
+    response = django_app.get(url, user=admin_user, params={"subtree": country.pk})
+    assert len(response.text.splitlines()) == 2
+
+    url = reverse("unicef_locations:locations_export", args=["csv"])
+    response = django_app.get(url, user=admin_user, params={"parent": country.pk})
+    assert len(response.text.splitlines()) == 2
+    assert response.content_type == "text/csv"
+
+
+def test_api_location_export_resolution(django_app, admin_user, country):
+    url = reverse("unicef_locations:locations_export", args=["geojson"])
+    response = django_app.get(url, user=admin_user, params={"subtree": country.pk, "resolution": "coarse"})
+    assert json.loads(response.text.splitlines()[0])["geometry"]["type"] == "MultiPolygon"
+
+    response = django_app.get(url, user=admin_user, params={"simplify": "unknown"}, expect_errors=True)
+    assert response.status_code == 400
+
+
+def test_export_locations_command(tmp_path, country):
+    path = tmp_path / "locations.csv"
+    call_command("export_locations", str(path), export_format="csv")
+    assert len(path.read_text().splitlines()) == 3
+
+
+def test_export_locations_geopackage(tmp_path, country):
+    fiona = pytest.importorskip("fiona")
+    path = tmp_path / "locations.gpkg"
+    call_command("export_locations", str(path), export_format="gpkg")
+    with fiona.open(path) as src:
+        assert len(src) == 2
@@ -0,0 +1,101 @@
+import warnings
+from datetime import timedelta
+
+from django.contrib.gis.geos import GEOSGeometry
+from django.urls import reverse
+from django.utils import timezone
+
+import pytest
+
+from unicef_locations.tests.factories import LocationFactory
+from unicef_locations.utils import get_location_model
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture()
+def tree():
+    country = LocationFactory(admin_level=0, geom=GEOSGeometry("MULTIPOLYGON(((0 0, 10 0, 10 10, 0 10, 0 0)))"))
+    region = LocationFactory(parent=country, admin_level=1, point=GEOSGeometry("POINT(5 5)"))
+    archived = LocationFactory(parent=country, admin_level=1, is_active=False, point=GEOSGeometry("POINT(50 50)"))
+    district = LocationFactory(parent=region, admin_level=2, point=GEOSGeometry("POINT(5 5)"))
+    other = LocationFactory(admin_level=0, point=GEOSGeometry("POINT(60 60)"))
+    return country, region, archived, district, other
+
+
+def get_ids(django_app, user, **params):
+    url = reverse("unicef_locations:locations-light-list")
+    response = django_app.get(url, user=user, params=params)
+    return sorted(int(row["id"]) for row in response.json)
+
+
+def test_filter_admin_level(django_app, admin_user, tree):
+    country, region, archived, district, other = tree
+    assert get_ids(django_app, admin_user, admin_level="1,2") == sorted([region.pk, archived.pk, district.pk])
+
+
+def test_filter_parent(django_app, admin_user, tree):
+    country, region, archived, district, other = tree
+    assert get_ids(django_app, admin_user, parent=country.pk) == sorted([region.pk, archived.pk])
+    assert get_ids(django_app, admin_user, parent="null") == sorted([country.pk, other.pk])
+
+
+def test_filter_is_active(django_app, admin_user, tree):
+    country, region, archived, district, other = tree
+    assert get_ids(django_app, admin_user, is_active="false") == [archived.pk]
+
+
+def test_filter_subtree(django_app, admin_user, tree):
+    country, region, archived, district, other = tree
+    assert get_ids(django_app, admin_user, subtree=region.pk) == sorted([region.pk, district.pk])
+    assert get_ids(django_app, admin_user, subtree=country.pk, is_active="true", admin_level=1) == [region.pk]
+
+
+def test_filter_ancestor(django_app, admin_user, tree):
+    country, region, archived, district, other = tree
+    assert get_ids(django_app, admin_user, ancestor=region.p_code) == sorted([region.pk, district.pk])
+    assert get_ids(django_app, admin_user, ancestor="unknown") == []
+
+
+def test_filter_modified(django_app, admin_user, tree):
+    country, region, archived, district, other = tree
+    get_location_model().objects.filter(pk=other.pk).update(modified=timezone.now() + timedelta(days=1))
+    assert get_ids(django_app, admin_user, modified__gt=timezone.now().isoformat()) == [other.pk]
+
+    # naive datetimes are in the current timezone
+    naive = timezone.localtime().replace(tzinfo=None).isoformat()
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", RuntimeWarning)
+        assert get_ids(django_app, admin_user, modified__gt=naive) == [other.pk]
+
+
+def test_filter_bbox(django_app, admin_user, tree):
+    country, region, archived, district, other = tree
+    assert get_ids(django_app, admin_user, bbox="4,4,6,6") == sorted([country.pk, region.pk, district.pk])
+
+
+def test_filter_is_valid(django_app, admin_user, tree):
+    country, region, archived, district, other = tree
+    assert get_ids(django_app, admin_user, is_valid="true") == [country.pk]
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"admin_level": "x"},
+        {"is_active": "maybe"},
+        {"is_valid": "maybe"},
+        {"modified__gt": "yesterday"},
+        {"modified__gt": "2024-02-30T00:00:00"},
+        {"bbox": "1,2"},
+        {"bbox": "nan,0,1,1"},
+        {"bbox": "0,0,inf,1"},
+        {"bbox": "2,0,1,1"},
+        {"bbox": "0,2,1,1"},
+        {"subtree": "x"},
+    ],
+)
+def test_filter_invalid(django_app, admin_user, params):
+    url = reverse("unicef_locations:locations-list")
+    response = django_app.get(url, user=admin_user, params=params, expect_errors=True)
+    assert response.status_code == 400
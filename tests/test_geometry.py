@@ -0,0 +1,110 @@
+from django.contrib.gis.geos import GEOSGeometry, MultiPolygon, Point
+from django.core.cache import cache
+from django.core.management import call_command
+
+import pytest
+
+from unicef_locations.config import conf
+from unicef_locations.geometry import defer_geometry_refresh, geometry_refresh_deferred, get_resolution, locate_points
+from unicef_locations.models import LocationGeometryPiece
+from unicef_locations.tests.factories import LocationFactory
+from unicef_locations.utils import get_location_model
+
+pytestmark = pytest.mark.django_db
+
+SQUARE = "MULTIPOLYGON(((0 0, 10 0, 10 10, 0 10, 0 0)))"
+
+
+def test_geometry_pieces_on_save(settings):
+    settings.UNICEF_LOCATIONS_GEOMETRY_PIECE_MAX_VERTICES = 8
+    location = LocationFactory(geom=GEOSGeometry(SQUARE))
+    assert LocationGeometryPiece.objects.filter(location=location).exists()
+
+    location.geom = None
+    location.save()
+    assert not LocationGeometryPiece.objects.filter(location=location).exists()
+
+
+def test_geometry_pieces_deferred():
+    with defer_geometry_refresh():
+        assert geometry_refresh_deferred()
+        location = LocationFactory(geom=GEOSGeometry(SQUARE))
+    assert not geometry_refresh_deferred()
+    assert not LocationGeometryPiece.objects.filter(location=location).exists()
+
+    version = cache.get(conf.CACHE_VERSION_KEY)
+    call_command("refresh_locations", admin_level=[location.admin_level])
+    assert LocationGeometryPiece.objects.filter(location=location).exists()
+    assert cache.get(conf.CACHE_VERSION_KEY) != version
+
+
+def test_locations_containing():
+    location = LocationFactory(geom=GEOSGeometry(SQUARE))
+    LocationFactory(geom=GEOSGeometry("MULTIPOLYGON(((20 20, 30 20, 30 30, 20 30, 20 20)))"))
+
+    assert list(get_location_model().objects.containing(Point(5, 5))) == [location]
+    assert not get_location_model().objects.containing(Point(50, 50)).exists()
+
+
+def test_representative_point():
+    location = LocationFactory(geom=GEOSGeometry(SQUARE), point=None)
+    location = get_location_model().objects.defer("geom").get(pk=location.pk)
+    assert location.representative_point.within(GEOSGeometry(SQUARE))
+    assert location.geo_point == location.representative_point
+    assert "geom" in location.get_deferred_fields()
+
+
+def test_simplified_geometries(settings):
+    settings.UNICEF_LOCATIONS_SIMPLIFY_TOLERANCES = {"coarse": 1, "medium": 0.1, "fine": 0.001}
+    location = LocationFactory(geom=MultiPolygon(Point(0, 0).buffer(10, quadsegs=64)))
+    location.refresh_from_db()
+
+    assert location.geom_coarse.num_points < location.geom_medium.num_points <= location.geom_fine.num_points
+    assert location.geom_fine.num_points <= location.geom.num_points
+    assert location.geom_coarse.geom_type == "MultiPolygon"
+
+
+def test_get_resolution():
+    assert get_resolution({}) is None
+    assert get_resolution({"resolution": "full"}) is None
+    assert get_resolution({"resolution": "coarse"}) == "coarse"
+    assert get_resolution({"simplify": "fine"}) == "fine"
+    with pytest.raises(ValueError):
+        get_resolution({"resolution": "unknown"})
+
+
+def test_geometry_metadata():
+    location = LocationFactory(geom=GEOSGeometry(SQUARE))
+    location.refresh_from_db()
+    assert (location.bbox_xmin, location.bbox_ymin, location.bbox_xmax, location.bbox_ymax) == (0, 0, 10, 10)
+    assert location.area > 1e12
+    assert location.is_valid is True
+
+    point = LocationFactory(point=Point(5, 6))
+    point.refresh_from_db()
+    assert (point.bbox_xmin, point.bbox_ymin, point.bbox_xmax, point.bbox_ymax) == (5, 6, 5, 6)
+    assert point.is_valid is None
+
+
+def test_repair_geometries():
+    bowtie = GEOSGeometry("MULTIPOLYGON(((0 0, 10 10, 10 0, 0 10, 0 0)))")
+    location = LocationFactory(geom=bowtie)
+    location.refresh_from_db()
+    assert location.is_valid is False
+
+    call_command("refresh_locations", admin_level=[location.admin_level], repair=True)
+
+    location.refresh_from_db()
+    assert location.is_valid is True
+    assert location.geom.geom_type == "MultiPolygon"
+
+
+def test_locate_points():
+    location = LocationFactory(geom=GEOSGeometry(SQUARE), admin_level=1)
+    LocationFactory(geom=GEOSGeometry("MULTIPOLYGON(((5 0, 15 0, 15 10, 5 10, 5 0)))"), admin_level=1)
+
+    located = locate_points([Point(2, 2).wkb, Point(50, 50).wkb, None, Point(7, 7).wkb], admin_level=1)
+
+    assert located[0] == [location.pk]
+    assert located[1] == located[2] == []
+    assert len(located[3]) == 2
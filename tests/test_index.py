@@ -0,0 +1,58 @@
+from django.contrib.gis.geos import GEOSGeometry
+
+import pytest
+
+from unicef_locations.cache import invalidate_cache
+from unicef_locations.tests.factories import LocationFactory
+
+np = pytest.importorskip("numpy")
+index_module = pytest.importorskip("unicef_locations.index")
+LocationIndex, NOT_FOUND = index_module.LocationIndex, index_module.NOT_FOUND
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture()
+def country_and_region():
+    country = LocationFactory(
+        admin_level=0, geom=GEOSGeometry("MULTIPOLYGON(((0 0, 10 0, 10 10, 0 10, 0 0)))"), point=None
+    )
+    region = LocationFactory(
+        parent=country,
+        admin_level=1,
+        geom=GEOSGeometry("MULTIPOLYGON(((0 0, 5 0, 5 5, 0 5, 0 0)))"),
+        point=None,
+    )
+    return country, region
+
+
+def test_location_index_locate(country_and_region):
+    country, region = country_and_region
+    index = LocationIndex(admin_levels=[0, 1])
+    result = index.locate(np.array([[1, 1], [8, 8], [20, 20]]))
+    assert result.tolist() == [region.pk, country.pk, NOT_FOUND]
+
+
+def test_location_index_query(country_and_region):
+    country, region = country_and_region
+    index = LocationIndex()
+    point_idx, location_ids = index.query([[1, 1]])
+    assert point_idx.tolist() == [0, 0]
+    assert sorted(location_ids.tolist()) == sorted([country.pk, region.pk])
+
+
+def test_location_index_subdivided(country_and_region):
+    country, region = country_and_region
+    index = LocationIndex(admin_levels=[0], max_vertices=4, simplify_tolerance=0.001)
+    assert index.locate([[5, 5], [9, 1]]).tolist() == [country.pk, country.pk]
+    assert len(index.geometries) > 1
+
+
+def test_location_index_reload(country_and_region):
+    country, region = country_and_region
+    index = LocationIndex(admin_levels=[1])
+    assert index.locate([[1, 1]]).tolist() == [region.pk]
+
+    region.is_active = False
+    region.save()
+    invalidate_cache()
+    assert index.locate([[1, 1]]).tolist() == [NOT_FOUND]
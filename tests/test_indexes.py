@@ -0,0 +1,60 @@
+from django.contrib.gis.geos import Point, Polygon
+from django.db import connection, IntegrityError
+from rest_framework.request import Request
+
+import pytest
+
+from unicef_locations.filters import LocationFilterBackend
+from unicef_locations.tests.factories import LocationFactory
+from unicef_locations.utils import get_location_model
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture()
+def index_scans(locations3):
+    """
+    Test tables are tiny, so the planner would always choose sequential scans:
+    disabling them shows whether an index can serve the query.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+
+
+def assert_index_scan(queryset):
+    plan = queryset.explain()
+    assert "Seq Scan" not in plan, plan
+    assert "Index" in plan, plan
+
+
+def test_pcode_lookup_plan(index_scans):
+    model = get_location_model()
+    assert_index_scan(model.objects.filter(p_code="PCODE1", is_active=True))
+    assert_index_scan(model.objects.select_related(None).filter(p_code__in=["PCODE1", "PCODE2"], is_active=True))
+
+
+def test_admin_level_lookup_plan(index_scans):
+    assert_index_scan(get_location_model().objects.filter(admin_level=1, is_active=False))
+
+
+def test_spatial_lookup_plan(index_scans):
+    model = get_location_model()
+    assert_index_scan(model.objects.containing(Point(1, 1, srid=4326)))
+    bbox = Polygon.from_bbox((0, 0, 1, 1))
+    bbox.srid = 4326
+    assert_index_scan(model.objects.filter(point__bboverlaps=bbox))
+
+
+def test_bbox_filter_plan(index_scans, rf):
+    request = Request(rf.get("/", {"bbox": "0,0,1,1"}))
+    queryset = LocationFilterBackend().filter_queryset(request, get_location_model().objects.all(), None)
+    assert "bbox_idx" in queryset.explain()
+    assert_index_scan(queryset)
+
+
+def test_active_pcode_unique(location):
+    LocationFactory(p_code=location.p_code, is_active=False)
+    LocationFactory(p_code="", is_active=True)
+    LocationFactory(p_code="", is_active=True)
+    with pytest.raises(IntegrityError):
+        LocationFactory(p_code=location.p_code, is_active=True)
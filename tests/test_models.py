@@ -1,6 +1,12 @@
 from django.test import SimpleTestCase
 
+import pytest
+from unittest.mock import patch
+
+from unicef_locations.ancestry import refresh_ancestry
+from unicef_locations.cache import invalidate_cache
 from unicef_locations.tests.factories import CartoDBTableFactory, LocationFactory
+from unicef_locations.utils import get_location_model
 
 
 def test_point_lat_long(location):
@@ -25,3 +31,88 @@ class TestStrUnicode(SimpleTestCase):
 
         carto_db_table = CartoDBTableFactory.build(table_name="xyz")
         self.assertEqual(str(carto_db_table), "xyz")
+
+
+@pytest.mark.django_db
+def test_lean(locations3):
+    location = get_location_model().objects.lean().get(pk=locations3[0].pk)
+    assert "geom" in location.get_deferred_fields()
+    assert not location._state.fields_cache
+
+
+@pytest.mark.django_db
+def test_with_parent_name():
+    parent = LocationFactory(name="Parent")
+    child = LocationFactory(parent=parent)
+    location = get_location_model().objects.with_parent_name().get(pk=child.pk)
+    assert "geom" in location.get_deferred_fields()
+    assert location._state.fields_cache["parent"].name == "Parent"
+    assert "geom" in location.parent.get_deferred_fields()
+    assert "p_code" in location.parent.get_deferred_fields()
+
+
+@pytest.mark.django_db
+def test_ancestry_columns():
+    country = LocationFactory(name="Country", p_code="C", admin_level_name="Country")
+    region = LocationFactory(name="Region", p_code="C1", admin_level_name="Region", parent=country)
+    assert region.display_name == str(region)
+    assert region.full_name == f"{region} -- Country"
+    assert region.ancestry_pcodes == "/C/C1/"
+    assert region.ancestry_names == "Country > Region"
+
+
+@pytest.mark.django_db
+def test_ancestry_propagated_to_descendants():
+    country = LocationFactory(name="Country", p_code="C")
+    region = LocationFactory(name="Region", p_code="C1", parent=country)
+    district = LocationFactory(name="District", p_code="C11", parent=region)
+
+    country.refresh_from_db()
+    country.name = "Renamed"
+    country.p_code = "R"
+    country.save()
+
+    district.refresh_from_db()
+    assert district.ancestry_pcodes == "/R/C1/C11/"
+    assert district.ancestry_names == "Renamed > Region > District"
+    region.refresh_from_db()
+    assert region.full_name.endswith(" -- Renamed")
+
+
+@pytest.mark.django_db
+def test_cache_invalidated_once_per_transaction(django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks() as callbacks:
+        location = LocationFactory()
+        LocationFactory(parent=location)
+        location.delete()
+    assert callbacks == [invalidate_cache]
+
+
+@pytest.mark.django_db
+def test_ancestry_not_propagated_when_unchanged():
+    country = LocationFactory(name="Country", p_code="C")
+    LocationFactory(name="Region", p_code="C1", parent=country)
+
+    country.refresh_from_db()
+    country.point = "POINT(1 2)"
+    with patch("unicef_locations.models.refresh_ancestry") as mock_refresh:
+        country.save()
+        mock_refresh.assert_not_called()
+
+        country.name = "Renamed"
+        country.save()
+        mock_refresh.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_refresh_ancestry():
+    country = LocationFactory(name="Country", p_code="C")
+    region = LocationFactory(name="Region", p_code="C1", parent=country)
+    expected = get_location_model().objects.values("display_name", "full_name", "ancestry_pcodes", "ancestry_names")
+    expected = list(expected.order_by("pk"))
+    get_location_model().objects.update(display_name="", full_name="", ancestry_pcodes="", ancestry_names="")
+
+    refresh_ancestry(get_location_model().objects.filter(pk__in=[country.pk, region.pk]))
+
+    refreshed = get_location_model().objects.values("display_name", "full_name", "ancestry_pcodes", "ancestry_names")
+    assert list(refreshed.order_by("pk")) == expected
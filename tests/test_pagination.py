@@ -0,0 +1,54 @@
+import base64
+import json
+
+from django.urls import reverse
+
+import pytest
+
+from unicef_locations.tests.factories import LocationFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+@pytest.mark.parametrize("ordering", ["id", "tree"])
+def test_api_location_cursor_pagination(django_app, admin_user, ordering):
+    root = LocationFactory()
+    locations = [root] + [LocationFactory(parent=root) for _ in range(4)] + [LocationFactory()]
+    url = reverse("unicef_locations:locations-light-list")
+
+    seen = []
+    response = django_app.get(url, user=admin_user, params={"page_size": 2, "ordering": ordering})
+    while True:
+        assert len(response.json["results"]) <= 2
+        seen += [int(row["id"]) for row in response.json["results"]]
+        if not response.json["next"]:
+            break
+        response = django_app.get(response.json["next"], user=admin_user)
+    assert sorted(seen) == sorted(location.pk for location in locations)
+    assert len(seen) == len(set(seen))
+
+
+def test_api_location_unpaginated(django_app, admin_user, locations3):
+    url = reverse("unicef_locations:locations-list")
+    response = django_app.get(url, user=admin_user)
+    assert len(response.json) == len(locations3)
+
+
+@pytest.mark.parametrize(
+    "params, status_code",
+    [
+        ({"cursor": "invalid"}, 404),
+        ({"cursor": encode_cursor(["x"])}, 404),
+        ({"cursor": encode_cursor([{}])}, 404),
+        ({"cursor": encode_cursor([True])}, 404),
+        ({"ordering": "name"}, 400),
+    ],
+)
+def test_api_location_cursor_invalid(django_app, admin_user, locations3, params, status_code):
+    url = reverse("unicef_locations:locations-list")
+    response = django_app.get(url, user=admin_user, params={"page_size": 2, **params}, expect_errors=True)
+    assert response.status_code == status_code
@@ -0,0 +1,102 @@
+import base64
+import json
+
+import pytest
+
+from unicef_locations.preprocessing import (
+    dump_prepared,
+    load_prepared,
+    MULTIPOLYGON,
+    POINT,
+    prepare_batch_geos,
+    prepare_batch_shapely,
+    preprocess_geometries,
+    TWKB,
+    WKB,
+)
+
+pytest.importorskip("shapely")
+
+SQUARE = {"type": "Polygon", "coordinates": [[[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]]]}
+BOWTIE = {"type": "MultiPolygon", "coordinates": [[[[0, 0], [10, 10], [10, 0], [0, 10], [0, 0]]]]}
+
+
+def test_preprocess_geometries(settings):
+    settings.UNICEF_LOCATIONS_PREPROCESS_WORKERS = 1
+    settings.UNICEF_LOCATIONS_PREPROCESS_BATCH_SIZE = 2
+    point = {"type": "Point", "coordinates": [1, 2]}
+    line = {"type": "LineString", "coordinates": [[1, 2], [3, 4]]}
+    geojsons = [json.dumps(SQUARE), json.dumps(point), json.dumps(line), "invalid", None]
+
+    square, point, line, invalid, missing = preprocess_geometries(geojsons)
+
+    assert square.geom_type == MULTIPOLYGON
+    assert square.is_valid and square.wkb and square.fingerprint
+    assert point.geom_type == POINT
+    assert line.wkb is None and line.error == "Unsupported geometry type LineString"
+    assert invalid.wkb is None and invalid.error == "Invalid GeoJSON"
+    assert missing.wkb is None
+
+
+def test_preprocess_geometries_encodings(settings):
+    settings.UNICEF_LOCATIONS_PREPROCESS_WORKERS = 1
+    (square,) = preprocess_geometries([json.dumps(SQUARE)])
+    hex_wkb = bytes(square.wkb).hex()
+    # ST_AsTWKB of the square, base64 encoded by the query
+    twkb = base64.b64encode(bytes.fromhex("0300010500001400001413000013")).decode()
+
+    from_wkb, invalid_wkb = preprocess_geometries([hex_wkb, "invalid"], encoding=WKB)
+    from_twkb, invalid_twkb = preprocess_geometries([twkb, "invalid"], encoding=TWKB)
+
+    assert from_wkb.fingerprint == from_twkb.fingerprint == square.fingerprint
+    assert from_twkb.geom_type == MULTIPOLYGON
+    assert invalid_wkb.error == "Invalid WKB"
+    assert invalid_twkb.error == "Invalid TWKB"
+
+
+def test_preprocess_geometries_fingerprint(settings):
+    settings.UNICEF_LOCATIONS_PREPROCESS_WORKERS = 1
+    # same square, starting from another vertex
+    rotated = {"type": "Polygon", "coordinates": [[[10, 0], [10, 10], [0, 10], [0, 0], [10, 0]]]}
+    square, other = preprocess_geometries([json.dumps(SQUARE), json.dumps(rotated)])
+    assert square.fingerprint == other.fingerprint
+
+
+def test_preprocess_geometries_repair(settings):
+    settings.UNICEF_LOCATIONS_PREPROCESS_WORKERS = 1
+    (invalid,) = preprocess_geometries([json.dumps(BOWTIE)])
+    assert not invalid.is_valid and not invalid.repaired
+
+    (repaired,) = preprocess_geometries([json.dumps(BOWTIE)], repair=True)
+    assert repaired.is_valid and repaired.repaired
+    assert repaired.geom_type == MULTIPOLYGON
+
+
+@pytest.mark.parametrize("prepare_batch", [prepare_batch_shapely, prepare_batch_geos])
+def test_prepare_batch_unrepairable(prepare_batch):
+    # collapsed ring, made valid into a line
+    flat = {"type": "Polygon", "coordinates": [[[0, 0], [1, 1], [2, 2], [0, 0]]]}
+    (prepared,) = prepare_batch([json.dumps(flat)], repair=True)
+    assert prepared.wkb is None and prepared.repaired
+    assert prepared.error == "Geometry cannot be repaired"
+
+
+def test_preprocess_geometries_simplify(settings):
+    settings.UNICEF_LOCATIONS_PREPROCESS_WORKERS = 1
+    dense = {"type": "Polygon", "coordinates": [[[0, 0], [5, 0.001], [10, 0], [10, 10], [0, 10], [0, 0]]]}
+    (full,) = preprocess_geometries([json.dumps(dense)])
+    (simplified,) = preprocess_geometries([json.dumps(dense)], tolerance=0.1)
+    assert len(simplified.wkb) < len(full.wkb)
+
+
+def test_preprocess_geometries_workers(settings):
+    settings.UNICEF_LOCATIONS_PREPROCESS_WORKERS = 2
+    settings.UNICEF_LOCATIONS_PREPROCESS_BATCH_SIZE = 1
+    prepared = preprocess_geometries([json.dumps(SQUARE)] * 3)
+    assert [geometry.geom_type for geometry in prepared] == [MULTIPOLYGON] * 3
+
+
+def test_dump_prepared(settings):
+    settings.UNICEF_LOCATIONS_PREPROCESS_WORKERS = 1
+    prepared = preprocess_geometries([json.dumps(SQUARE), "invalid"])
+    assert load_prepared(json.loads(json.dumps(dump_prepared(prepared)))) == prepared
@@ -0,0 +1,61 @@
+import json
+
+from django.urls import reverse
+
+import pytest
+
+from unicef_locations.renderers import ColumnarJSONRenderer, to_columns
+
+
+def test_to_columns():
+    rows = [
+        {"id": "1", "admin_level_name": "Country"},
+        {"id": "2", "admin_level_name": "Region"},
+        {"id": "3", "admin_level_name": "Region"},
+    ]
+    assert to_columns(rows, ["admin_level_name"]) == {
+        "count": 3,
+        "fields": ["id", "admin_level_name"],
+        "columns": {"id": ["1", "2", "3"], "admin_level_name": [0, 1, 1]},
+        "dictionaries": {"admin_level_name": ["Country", "Region"]},
+    }
+
+
+def test_columnar_renderer_errors():
+    assert json.loads(ColumnarJSONRenderer().render({"detail": "error"})) == {"detail": "error"}
+
+
+def test_api_location_light_list_columnar(django_app, admin_user, locations3):
+    url = reverse("unicef_locations:locations-light-list")
+    response = django_app.get(url, user=admin_user, headers={"Accept": ColumnarJSONRenderer.media_type})
+    assert response.json["count"] == len(locations3)
+    assert sorted(response.json["columns"]["id"]) == sorted(str(location.pk) for location in locations3)
+
+    assert "Accept" in response["Vary"]
+
+    json_response = django_app.get(url, user=admin_user)
+    assert json_response["ETag"] != response["ETag"]
+    assert "Accept" in json_response["Vary"]
+    response = django_app.get(
+        url,
+        user=admin_user,
+        headers={"Accept": ColumnarJSONRenderer.media_type, "If-None-Match": response["ETag"]},
+    )
+    assert response.status_code == 304
+
+
+def test_api_location_list_msgpack(django_app, admin_user, locations3):
+    msgpack = pytest.importorskip("msgpack")
+    url = reverse("unicef_locations:locations-list")
+    response = django_app.get(url, user=admin_user, headers={"Accept": "application/msgpack"})
+    assert response.content_type == "application/msgpack"
+    assert len(msgpack.unpackb(response.body)) == len(locations3)
+
+
+def test_api_location_list_renderer_settings(django_app, admin_user, settings, locations3):
+    url = reverse("unicef_locations:locations-light-list")
+    assert django_app.get(url, user=admin_user, headers={"Accept": "text/html"}).status_code == 200
+
+    settings.REST_FRAMEWORK = {"DEFAULT_RENDERER_CLASSES": ["rest_framework.renderers.JSONRenderer"]}
+    response = django_app.get(url, user=admin_user, headers={"Accept": "text/html"}, expect_errors=True)
+    assert response.status_code == 406
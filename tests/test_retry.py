@@ -0,0 +1,85 @@
+import requests
+from carto.exceptions import CartoException
+from pyrestcli.exceptions import BadRequestException, ServerErrorException
+
+import pytest
+from unittest.mock import Mock
+
+from unicef_locations import retry
+from unicef_locations.exceptions import CircuitOpen
+from unicef_locations.retry import get_retry_policy, get_stats, RetryPolicy
+
+SERVER_ERROR = CartoException(ServerErrorException("unavailable", 503))
+BAD_REQUEST = CartoException(BadRequestException("syntax error", 400))
+
+
+@pytest.fixture(autouse=True)
+def reset_retry():
+    retry.reset()
+    yield
+    retry.reset()
+
+
+@pytest.mark.parametrize(
+    "error, retryable",
+    [
+        (SERVER_ERROR, True),
+        (CartoException(requests.ConnectionError("reset")), True),
+        (requests.Timeout(), True),
+        (BAD_REQUEST, False),
+        (CartoException("Invalid CartoDBTable"), False),
+    ],
+)
+def test_is_retryable(error, retryable):
+    assert RetryPolicy().is_retryable(error) == retryable
+
+
+def test_get_delay():
+    policy = RetryPolicy(base_delay=1, max_delay=5)
+    assert 0 <= policy.get_delay(1) <= 1
+    assert 0 <= policy.get_delay(10) <= 5
+
+
+def test_call_retries():
+    sleep = Mock()
+    func = Mock(side_effect=[SERVER_ERROR, SERVER_ERROR, "rows"])
+    assert RetryPolicy(max_attempts=3, sleep=sleep).call("unicef", func, "select 1") == "rows"
+    assert sleep.call_count == 2
+    func.assert_called_with("select 1")
+    stats = get_stats("unicef")
+    assert stats["calls"] == 1 and stats["attempts"] == 3 and stats["retries"] == 2 and stats["failures"] == 0
+
+
+def test_call_not_retryable():
+    sleep = Mock()
+    with pytest.raises(CartoException):
+        RetryPolicy(sleep=sleep).call("unicef", Mock(side_effect=BAD_REQUEST))
+    sleep.assert_not_called()
+    assert get_stats("unicef")["failures"] == 1
+
+
+def test_circuit_breaker(settings):
+    settings.UNICEF_LOCATIONS_CARTO_CIRCUIT_FAILURE_THRESHOLD = 2
+    policy = RetryPolicy(max_attempts=1, sleep=Mock())
+    func = Mock(side_effect=SERVER_ERROR)
+    for _ in range(2):
+        with pytest.raises(CartoException):
+            policy.call("unicef", func)
+
+    with pytest.raises(CircuitOpen):
+        policy.call("unicef", func)
+    assert func.call_count == 2
+    assert get_stats("unicef")["rejected"] == 1
+    # other domains are not affected
+    assert policy.call("other", Mock(return_value="rows")) == "rows"
+
+    # a trial request is let through after the reset timeout, its success closes the circuit
+    retry.get_circuit_breaker("unicef").reset_timeout = 0
+    assert policy.call("unicef", Mock(return_value="rows")) == "rows"
+    assert retry.get_circuit_breaker("unicef").state == retry.CircuitBreaker.CLOSED
+
+
+def test_get_retry_policy(settings):
+    settings.UNICEF_LOCATIONS_CARTO_RETRY_MAX_ATTEMPTS = 2
+    assert get_retry_policy().max_attempts == 2
+    assert get_retry_policy(max_attempts=7).max_attempts == 7
@@ -19,6 +19,27 @@ def test_LocationExportSerializer(location):
 def test_LocationExportFlatSerializer(location):
     ser = LocationExportFlatSerializer(instance=location)
     assert ser.data
+    # the stored derived columns are not exported
+    assert list(ser.data) == [
+        "id",
+        "name_display",
+        "geom",
+        "point",
+        "name",
+        "admin_level",
+        "admin_level_name",
+        "latitude",
+        "longitude",
+        "p_code",
+        "is_active",
+        "created",
+        "modified",
+        "lft",
+        "rght",
+        "tree_id",
+        "level",
+        "parent",
+    ]
 
 
 def test_LocationLightSerializer(location):
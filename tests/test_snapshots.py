@@ -0,0 +1,77 @@
+import gzip
+import json
+
+from django.core.files.storage import default_storage
+from django.test import RequestFactory
+from django.urls import reverse
+from django.views.static import serve
+
+import pytest
+from unittest.mock import patch
+
+from unicef_locations.cache import get_cache_version
+from unicef_locations.config import conf
+from unicef_locations.snapshots import build_snapshots, get_snapshot_name
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture()
+def snapshot_settings(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.MEDIA_URL = "/media/"
+    settings.UNICEF_LOCATIONS_SNAPSHOT_GEOJSON = True
+    return settings
+
+
+def test_build_snapshots(snapshot_settings, locations3):
+    build_snapshots()
+    name = get_snapshot_name(get_cache_version(), "locations-light")
+    with default_storage.open(name) as snapshot:
+        data = json.loads(gzip.decompress(snapshot.read()))
+    assert sorted(row["id"] for row in data) == sorted(str(location.pk) for location in locations3)
+    assert default_storage.exists(get_snapshot_name(get_cache_version(), "locations", "geojson"))
+
+
+@patch("unicef_locations.tasks.build_locations_snapshots.delay")
+def test_api_location_list_snapshot(
+    mock_delay, snapshot_settings, django_app, admin_user, locations3, django_capture_on_commit_callbacks
+):
+    snapshot_settings.UNICEF_LOCATIONS_SNAPSHOT_MODE = "x-accel"
+    url = reverse("unicef_locations:locations-light-list")
+
+    # not built yet: served by django, build scheduled
+    with django_capture_on_commit_callbacks(execute=True):
+        response = django_app.get(url, user=admin_user)
+    assert len(response.json) == len(locations3)
+    assert mock_delay.call_count == 1
+
+    build_snapshots()
+    response = django_app.get(url, user=admin_user)
+    name = get_snapshot_name(get_cache_version(), "locations-light")
+    # nginx gzip_static serves the gzipped snapshot of the uncompressed name
+    target = response["X-Accel-Redirect"]
+    assert target == f"{conf.SNAPSHOT_ACCEL_PREFIX}{name[:-3]}"
+    assert response["Content-Type"] == "application/json"
+    assert "Content-Encoding" not in response.headers
+    assert default_storage.exists(f"{target.removeprefix(conf.SNAPSHOT_ACCEL_PREFIX)}.gz")
+
+    # filtered variants are always served by django
+    response = django_app.get(url, user=admin_user, params={"is_active": "true"})
+    assert "X-Accel-Redirect" not in response.headers
+
+
+@patch("unicef_locations.tasks.build_locations_snapshots.delay")
+def test_api_location_list_snapshot_redirect(mock_delay, snapshot_settings, django_app, admin_user, locations3):
+    snapshot_settings.UNICEF_LOCATIONS_SNAPSHOT_MODE = "redirect"
+    build_snapshots()
+    response = django_app.get(reverse("unicef_locations:locations-list"), user=admin_user)
+    assert response.status_code == 302
+
+    # what a client following the redirect to a storage deriving the metadata from the name receives
+    path = response["Location"].split(snapshot_settings.MEDIA_URL, 1)[1]
+    snapshot = serve(RequestFactory().get(response["Location"]), path, document_root=snapshot_settings.MEDIA_ROOT)
+    assert snapshot["Content-Type"] == "application/json"
+    assert snapshot["Content-Encoding"] == "gzip"
+    data = json.loads(gzip.decompress(b"".join(snapshot.streaming_content)))
+    assert sorted(row["id"] for row in data) == sorted(str(location.pk) for location in locations3)
@@ -1,11 +1,16 @@
 import requests
 from carto.exceptions import CartoException
+from django.contrib.gis.geos import GEOSGeometry
+from django.db import IntegrityError, transaction
 
 import pytest
 from unittest.mock import call, patch
 
+from unicef_locations.exceptions import InvalidRemap
+from unicef_locations.models import GEOMETRY_ENCODING_TWKB, GEOMETRY_ENCODING_WKB, PARENT_ASSIGNMENT_SPATIAL
 from unicef_locations.synchronizers import LocationSynchronizer
 from unicef_locations.tests.factories import LocationFactory
+from unicef_locations.utils import get_location_model
 
 from demo.sample.models import DemoModel
 
@@ -63,6 +68,20 @@ def test_location_synchronizer_get_cartodb_locations_exception(logger_mock, mock
     )
 
 
+def test_location_synchronizer_get_geometry_query(cartodbtable):
+    synchronizer = LocationSynchronizer(pk=cartodbtable.pk)
+    assert synchronizer.get_geometry_query() == "st_AsGeoJSON(the_geom) as the_geom"
+
+    synchronizer.carto.geometry_precision = 5
+    assert synchronizer.get_geometry_query() == "st_AsGeoJSON(the_geom, 5) as the_geom"
+
+    synchronizer.carto.geometry_encoding = GEOMETRY_ENCODING_TWKB
+    assert synchronizer.get_geometry_query() == "encode(ST_AsTWKB(the_geom, 5), 'base64') as the_geom"
+
+    synchronizer.carto.geometry_encoding = GEOMETRY_ENCODING_WKB
+    assert synchronizer.get_base_query().startswith("select ST_AsHexEWKB(the_geom) as the_geom, ")
+
+
 @patch("carto.sql.SQLClient.send")
 def test_location_synchronizer_query_with_retries_exception(mock_send, cartodbtable):
     synchronizer = LocationSynchronizer(pk=cartodbtable.pk)
@@ -72,6 +91,15 @@ def test_location_synchronizer_query_with_retries_exception(mock_send, cartodbta
         synchronizer.query_with_retries(query, 0)
 
 
+@patch("carto.sql.SQLClient.send")
+def test_location_synchronizer_query_with_retries(mock_send, settings, cartodbtable):
+    settings.UNICEF_LOCATIONS_CARTO_RETRY_BASE_DELAY = 0
+    synchronizer = LocationSynchronizer(pk=cartodbtable.pk)
+    mock_send.side_effect = [CartoException(requests.ConnectionError("reset")), {"rows": [{"pcode": "RW"}]}]
+    assert synchronizer.query_with_retries("select pcode", 0) == [{"pcode": "RW"}]
+    assert mock_send.call_count == 2
+
+
 @patch("unicef_locations.synchronizers.LocationSynchronizer.get_cartodb_locations")
 @patch("logging.Logger.warning")
 def test_location_synchronizer_create_or_update_locations(
@@ -93,15 +121,9 @@ def test_location_synchronizer_create_or_update_locations(
     assert updated == 1
     assert new == skipped == error == 0
 
-    # test error: multiple location exception
-    LocationFactory(p_code="RW01", is_active=True)
-    with pytest.raises(CartoException):
-        new, updated, skipped, error = synchronizer.create_or_update_locations()
-        assert new == updated == skipped == 0
-        logger_mock.assert_called_with(
-            f"Multiple locations found for: {cartodbtable.admin_level}, "
-            f"{carto_response[0][cartodbtable.name_col]} ({carto_response[0][cartodbtable.pcode_col]})"
-        )
+    # multiple active locations with the same pcode are prevented by the database
+    with pytest.raises(IntegrityError), transaction.atomic():
+        LocationFactory(p_code="RW01", is_active=True)
 
     # test skipped location
     mock_cartodb_locations.return_value[0][cartodbtable.pcode_col] = ""
@@ -126,6 +148,33 @@ def test_location_synchronizer_handle_obsolete_locations(logger_mock, cartodbtab
     logger_mock.assert_has_calls(expected_calls)
 
 
+def test_location_synchronizer_apply_remap(cartodbtable):
+    synchronizer = LocationSynchronizer(pk=cartodbtable.pk)
+    LocationFactory(p_code="RW01", is_active=True)
+    LocationFactory(p_code="RW02", is_active=True)
+    LocationFactory(p_code="RW03", is_active=True)
+
+    # remap onto an active pcode
+    with pytest.raises(InvalidRemap):
+        synchronizer.apply_remap({"RW01": "RW02"})
+    # two old pcodes remapped to the same new one
+    with pytest.raises(InvalidRemap):
+        synchronizer.apply_remap({"RW01": "RW04", "RW03": "RW04"})
+
+    # the transaction is still usable
+    assert get_location_model().objects.filter(p_code="RW04", is_active=True).count() == 1
+
+
+@patch("unicef_locations.synchronizers.get_remapping")
+def test_location_synchronizer_sync_invalid_remap(mock_remapping, cartodbtable):
+    LocationFactory(p_code="RW01", is_active=True)
+    LocationFactory(p_code="RW02", is_active=True)
+    mock_remapping.return_value = {"RW01": "RW02"}, []
+    with pytest.raises(CartoException):
+        LocationSynchronizer(pk=cartodbtable.pk).sync()
+    assert get_location_model().objects.get(p_code="RW01").is_active
+
+
 @patch("logging.Logger.info")
 def test_location_synchronizer_clean_upper_level(logger_mock, cartodbtable):
     synchronizer = LocationSynchronizer(pk=cartodbtable.pk)
@@ -164,6 +213,20 @@ def test_location_synchronizer_sync(logger_mock, mock_cartodb_locations, cartodb
     new, updated, skipped, error = synchronizer.sync()
     assert updated == 1
     assert new == skipped == error == 0
+    location = get_location_model().objects.get(p_code="RW01", is_active=True)
+    assert location.geom_hash
+    assert location.geom.geom_type == "MultiPolygon"
+
+
+@patch("unicef_locations.cache.invalidate_cache")
+@patch("unicef_locations.synchronizers.LocationSynchronizer.get_cartodb_locations")
+def test_location_synchronizer_sync_invalidate_cache(
+    mock_cartodb_locations, mock_invalidate, cartodbtable, django_capture_on_commit_callbacks
+):
+    mock_cartodb_locations.return_value = []
+    with django_capture_on_commit_callbacks(execute=True):
+        LocationSynchronizer(pk=cartodbtable.pk).sync()
+    mock_invalidate.assert_called_once_with()
 
 
 @patch("unicef_locations.synchronizers.LocationSynchronizer.get_cartodb_locations")
@@ -186,3 +249,28 @@ def test_location_synchronizer_sync_nullable(logger_mock, mock_cartodb_locations
     assert not location_2.is_active
     expected_calls = [call("Apply Remap"), call("Create/Update new locations"), call("Clean upper level")]
     logger_mock.assert_has_calls(expected_calls)
+
+
+@patch("unicef_locations.synchronizers.LocationSynchronizer.get_cartodb_locations")
+def test_location_synchronizer_spatial_parents(mock_cartodb_locations, cartodbtable, carto_response):
+    cartodbtable.parent_assignment = PARENT_ASSIGNMENT_SPATIAL
+    cartodbtable.save()
+    parent = LocationFactory(
+        admin_level=cartodbtable.admin_level - 1,
+        geom=GEOSGeometry("MULTIPOLYGON(((28 -3, 30 -3, 30 -2, 28 -2, 28 -3)))"),
+        point=None,
+    )
+    unmatched = {
+        **carto_response[0],
+        cartodbtable.pcode_col: "RW02",
+        "the_geom": '{"type":"Point","coordinates":[0,0]}',
+    }
+    mock_cartodb_locations.return_value = carto_response + [unmatched]
+
+    synchronizer = LocationSynchronizer(pk=cartodbtable.pk)
+    new, updated, skipped, error = synchronizer.sync()
+
+    assert new == skipped == 1
+    location = get_location_model().objects.get(p_code="RW01", is_active=True)
+    assert location.parent == parent
+    assert synchronizer.parent_report == {"matched": 1, "ambiguous": {}, "unmatched": ["RW02"]}
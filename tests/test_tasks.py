@@ -0,0 +1,50 @@
+import json
+
+import pytest
+from unittest.mock import patch
+
+from unicef_locations.synchronizers import LocationSynchronizer
+from unicef_locations.tasks import fetch_locations_chunk, import_locations_distributed, merge_locations_chunks
+from unicef_locations.tests.factories import LocationFactory
+from unicef_locations.utils import get_location_model
+
+pytestmark = pytest.mark.django_db
+
+
+@patch("carto.sql.SQLClient.send")
+def test_get_page_plan(mock_send, settings, cartodbtable):
+    settings.UNICEF_LOCATIONS_IMPORT_CHUNK_SIZE = 4950
+    mock_send.return_value = {"rows": [{"count": 11000, "max": 12000}]}
+    plan = LocationSynchronizer(pk=cartodbtable.pk).get_page_plan()
+    assert plan == [(0, 5000, 100), (5000, 10000, 100), (10000, 12000, 100)]
+
+
+@patch("celery.chord")
+@patch("unicef_locations.synchronizers.LocationSynchronizer.get_page_plan")
+def test_import_locations_distributed(mock_plan, mock_chord, cartodbtable):
+    mock_plan.return_value = [(0, 100, 100), (100, 200, 100)]
+    import_locations_distributed(cartodbtable.pk)
+    header = mock_chord.call_args[0][0]
+    assert [task.args for task in header] == [(cartodbtable.pk, 0, 100, 100), (cartodbtable.pk, 100, 200, 100)]
+    assert mock_chord.return_value.call_args[0][0].args == (cartodbtable.pk,)
+
+
+@patch("unicef_locations.synchronizers.LocationSynchronizer.fetch_pages")
+def test_fetch_and_merge_locations_chunks(mock_fetch_pages, settings, cartodbtable, carto_response):
+    settings.UNICEF_LOCATIONS_PREPROCESS_WORKERS = 1
+    LocationFactory(p_code="RW", is_active=True)
+    cartodbtable.parent_code_col = "parent_code_col"
+    cartodbtable.save(update_fields=["parent_code_col"])
+    mock_fetch_pages.return_value = carto_response
+
+    # the chunks go through the celery result backend
+    chunk = json.loads(json.dumps(fetch_locations_chunk(cartodbtable.pk, 0, 100, 100)))
+    mock_fetch_pages.assert_called_once_with(0, 100, 100)
+    assert [row["the_geom"] for row in chunk["rows"]] == [True] * len(carto_response)
+
+    new, updated, skipped, error = merge_locations_chunks([chunk], cartodbtable.pk)
+    assert new == 1
+    assert skipped == updated == error == 0
+    location = get_location_model().objects.get(p_code="RW01", is_active=True)
+    assert location.parent.p_code == "RW"
+    assert location.geom_hash
@@ -0,0 +1,35 @@
+import pytest
+
+from unicef_locations.twkb import to_wkb
+
+shapely = pytest.importorskip("shapely")
+
+
+@pytest.mark.parametrize(
+    "data, wkt",
+    [
+        # ST_AsTWKB('POINT(1 2)')
+        ("01000204", "POINT (1 2)"),
+        # ST_AsTWKB('POINT(1.5 -2.3)', 1)
+        ("21001e2d", "POINT (1.5 -2.3)"),
+        # ST_AsTWKB('LINESTRING(1 1, 5 5)')
+        ("02000202020808", "LINESTRING (1 1, 5 5)"),
+        ("0300010500001400001413000013", "POLYGON ((0 0, 10 0, 10 10, 0 10, 0 0))"),
+        # two squares, the deltas of the second one start from the last point of the first one
+        (
+            "060002" "010500001400001413000013" "010500141400001413000013",
+            "MULTIPOLYGON (((0 0, 10 0, 10 10, 0 10, 0 0)), ((0 10, 10 10, 10 20, 0 20, 0 10)))",
+        ),
+        # with size and bounding box
+        ("0303" "0c" "00140014" "010500001400001413000013", "POLYGON ((0 0, 10 0, 10 10, 0 10, 0 0))"),
+        ("0610", "MULTIPOLYGON EMPTY"),
+    ],
+)
+def test_to_wkb(data, wkt):
+    assert shapely.from_wkb(to_wkb(bytes.fromhex(data))).wkt == wkt
+
+
+@pytest.mark.parametrize("data", ["03", "0300010500", "0880", "07000100"])
+def test_to_wkb_invalid(data):
+    with pytest.raises(ValueError):
+        to_wkb(bytes.fromhex(data))
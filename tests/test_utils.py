@@ -1,16 +1,32 @@
 import requests
 from carto.exceptions import CartoException
+from django.db import connection
 
 import pytest
 from unittest.mock import patch
 
 from unicef_locations.exceptions import InvalidRemap
 from unicef_locations.synchronizers import LocationSynchronizer
-from unicef_locations.utils import get_remapping
+from unicef_locations.tests.factories import LocationFactory
+from unicef_locations.utils import build_tree, deactivate_duplicate_pcodes, get_location_model, get_remapping
 
 pytestmark = pytest.mark.django_db
 
 
+def test_deactivate_duplicate_pcodes():
+    model = get_location_model()
+    # duplicates created before the unique active p_code constraint
+    constraint = next(constraint for constraint in model._meta.constraints if constraint.name.endswith("_active_pcode"))
+    with connection.schema_editor() as editor:
+        editor.remove_constraint(model, constraint)
+    older, newer = LocationFactory(p_code="RW01"), LocationFactory(p_code="RW01")
+    other = LocationFactory(p_code="RW02")
+
+    assert deactivate_duplicate_pcodes(model) == [(older.pk, "RW01")]
+    assert set(model.objects.filter(is_active=True).values_list("pk", flat=True)) == {newer.pk, other.pk}
+    assert deactivate_duplicate_pcodes(model) == []
+
+
 @patch("carto.sql.SQLClient.send")
 def test_get_remapping(mock_send, cartodbtable):
     cartodbtable.remap_table_name = "Remap table name"
@@ -62,3 +78,17 @@ def test_get_remapping_exception(mock_send, cartodbtable):
     mock_send.return_value = mock_resp
     with pytest.raises(CartoException):
         get_remapping(synchronizer.sql_client, cartodbtable)
+
+
+def test_build_tree():
+    nodes = [
+        {"id": "1", "parent": None},
+        {"id": "2", "parent": 1},
+        {"id": "3", "parent": 2},
+        {"id": "4", "parent": 1},
+        {"id": "5", "parent": 99},
+    ]
+    root, orphan = build_tree(nodes)
+    assert [node["id"] for node in root["children"]] == ["2", "4"]
+    assert [node["id"] for node in root["children"][0]["children"]] == ["3"]
+    assert orphan["id"] == "5"
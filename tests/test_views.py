@@ -3,7 +3,7 @@ from django.http import HttpResponse
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.request import Request
-from rest_framework.test import APIRequestFactory
+from rest_framework.test import APIClient, APIRequestFactory
 
 from unittest import mock
 
@@ -78,6 +78,21 @@ def test_api_location_queries(
         django_app.get(url, user=admin_user)
 
 
+def test_api_location_sparse_fields(django_app, admin_user, location):
+    LocationFactory(parent=location)
+    url = reverse("unicef_locations:locations-list")
+    response = django_app.get(url, user=admin_user, params={"fields": "id,p_code,geo_point"})
+    assert sorted(response.json[0].keys()) == ["geo_point", "id", "p_code"]
+
+    url = reverse("unicef_locations:locations-light-list")
+    response = django_app.get(url, user=admin_user, params={"fields": "id,name"})
+    assert sorted(response.json[0].keys()) == ["id", "name"]
+    assert any(" -- " in row["name"] for row in response.json)
+
+    response = django_app.get(url, user=admin_user, params={"fields": "id,geom"}, expect_errors=True)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
 def test_api_location_values(django_app, admin_user, locations3):
     l1, l2, l3 = locations3
     params = {"values": "{},{}".format(l1.id, l2.id)}
@@ -131,17 +146,93 @@ def test_api_location_list_cached(django_app, admin_user, locations3):
     assert response.status_code == status.HTTP_304_NOT_MODIFIED
 
 
-def test_api_location_list_modified(django_app, admin_user, locations3):
+def test_api_location_list_modified(django_app, admin_user, locations3, django_capture_on_commit_callbacks):
     url = reverse("unicef_locations:locations-list")
     response = django_app.get(url, user=admin_user)
     assert len(response.json) == len(locations3)
     etag = response["ETag"]
-    LocationFactory()
+    with django_capture_on_commit_callbacks(execute=True):
+        LocationFactory()
 
     response = django_app.get(url, user=admin_user, headers=dict(IF_NONE_MATCH=etag))
     assert len(response.json) == len(locations3) + 1
 
 
+def test_api_location_resolve(admin_user, locations3, django_assert_num_queries):
+    l1, l2, l3 = locations3
+    client = APIClient()
+    client.force_authenticate(admin_user)
+    url = reverse("unicef_locations:locations-resolve")
+    data = {"p_codes": [l1.p_code, "MISSING"], "ids": [l2.pk, 0]}
+
+    with django_assert_num_queries(1):
+        response = client.post(url, data, format="json")
+    assert response.status_code == status.HTTP_200_OK
+    assert sorted(row["id"] for row in response.data["results"]) == sorted([l1.pk, l2.pk])
+    assert response.data["not_found"] == {"p_codes": ["MISSING"], "ids": [0]}
+
+
+def test_api_location_resolve_invalid(admin_user, db, settings):
+    settings.UNICEF_LOCATIONS_BULK_LOOKUP_MAX_KEYS = 2
+    client = APIClient()
+    client.force_authenticate(admin_user)
+    url = reverse("unicef_locations:locations-resolve")
+
+    assert client.post(url, {}, format="json").status_code == status.HTTP_400_BAD_REQUEST
+    response = client.post(url, {"ids": [1, 2, 3]}, format="json")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_api_location_descendants_ancestors(django_app, admin_user, location):
+    child = LocationFactory(parent=location)
+    grandchild = LocationFactory(parent=child)
+
+    url = reverse("unicef_locations:locations-descendants", args=[location.pk])
+    response = django_app.get(url, user=admin_user)
+    assert [row["id"] for row in response.json] == [str(child.pk), str(grandchild.pk)]
+    response = django_app.get(url, user=admin_user, headers=dict(IF_NONE_MATCH=response["ETag"]))
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    url = reverse("unicef_locations:locations-ancestors", args=[grandchild.pk])
+    response = django_app.get(url, user=admin_user)
+    assert [row["id"] for row in response.json] == [str(location.pk), str(child.pk)]
+
+
+def test_api_location_tree(django_app, admin_user, location):
+    child_1 = LocationFactory(parent=location)
+    child_2 = LocationFactory(parent=location)
+    grandchild = LocationFactory(parent=child_1)
+
+    url = reverse("unicef_locations:locations-tree", args=[location.pk])
+    response = django_app.get(url, user=admin_user)
+    assert response.json["id"] == str(location.pk)
+    assert sorted(node["id"] for node in response.json["children"]) == sorted([str(child_1.pk), str(child_2.pk)])
+    nested = next(node for node in response.json["children"] if node["id"] == str(child_1.pk))
+    assert [node["id"] for node in nested["children"]] == [str(grandchild.pk)]
+
+
+def test_api_location_children(django_app, admin_user, location):
+    child = LocationFactory(parent=location)
+    LocationFactory(parent=child)
+    LocationFactory(parent=child)
+
+    url = reverse("unicef_locations:locations-children", args=[location.pk])
+    response = django_app.get(url, user=admin_user)
+    assert len(response.json) == 1
+    assert response.json[0]["id"] == str(child.pk)
+    assert response.json[0]["has_children"] is True
+    assert response.json[0]["descendant_count"] == 2
+
+    for pk in (0, "x"):
+        url = reverse("unicef_locations:locations-children", args=[pk])
+        assert django_app.get(url, user=admin_user, expect_errors=True).status_code == status.HTTP_404_NOT_FOUND
+
+    url = reverse("unicef_locations:locations-roots")
+    response = django_app.get(url, user=admin_user)
+    assert [row["id"] for row in response.json] == [str(location.pk)]
+    assert response.json[0]["descendant_count"] == 3
+
+
 def test_location_assert_etag(django_app, admin_user, locations3):
     url = reverse("unicef_locations:locations-list")
     factory = APIRequestFactory()
@@ -150,13 +241,16 @@ def test_location_assert_etag(django_app, admin_user, locations3):
     assert cache.get(conf.GET_CACHE_KEY(Request(request)))
 
 
-def test_location_delete_etag(django_app, admin_user, locations3):
+def test_location_delete_etag(django_app, admin_user, locations3, django_capture_on_commit_callbacks):
     url = reverse("unicef_locations:locations-list")
     factory = APIRequestFactory()
     request = factory.get(url)
     LocationsViewSet.as_view({"get": "list"})(request)
     etag_before = cache.get(conf.GET_CACHE_KEY(Request(request)))
-    get_location_model().objects.all().delete()
+    with django_capture_on_commit_callbacks(execute=True):
+        get_location_model().objects.all().delete()
+        # the etag is invalidated once the change is committed
+        assert cache.get(conf.GET_CACHE_KEY(Request(request))) == etag_before
 
     LocationsViewSet.as_view({"get": "list"})(request)
     etag_after = cache.get(conf.GET_CACHE_KEY(Request(request)))